@@ -0,0 +1,67 @@
+# Vectorized Arbitrage Engine
+import numpy as np
+
+# Funding interval assumed when an exchange does not report one (hours)
+DEFAULT_INTERVAL_HOURS = 8
+HOURS_PER_YEAR = 24 * 365
+
+
+def build_rate_matrix(market_data, exchanges=None):
+    """
+    Turns a collection pass into NumPy matrices of shape (symbols, exchanges):
+    raw funding rates (NaN where missing) and funding intervals in hours.
+    """
+    names = list(exchanges or market_data["exchanges"])
+    symbols = market_data["symbols"]
+    rates = np.array(
+        [[market_data["rates"][name].get(symbol) for name in names] for symbol in symbols],
+        dtype=float,
+    ).reshape(len(symbols), len(names))
+    intervals = np.array(
+        [[market_data["intervals"][name].get(symbol) for name in names] for symbol in symbols],
+        dtype=float,
+    ).reshape(len(symbols), len(names))
+    intervals[np.isnan(intervals) | (intervals <= 0)] = DEFAULT_INTERVAL_HOURS
+    return symbols, names, rates, intervals
+
+
+def rank_arbitrage(market_data, k=10, exchanges=None):
+    """
+    Returns the top-k arbitrage opportunities (by annualized APR) across the given exchanges
+    (default: all collected exchanges).
+
+    Each rate is annualized with its own funding interval (rate * payments per year * 100), then
+    the spread of every (long, short) exchange pair is computed for all symbols at once. Missing
+    rates are masked out, so a symbol needs at least two quoted exchanges to be ranked.
+    """
+    symbols, names, rates, intervals = build_rate_matrix(market_data, exchanges)
+    if not symbols or len(names) < 2 or k <= 0:
+        return []
+    # Annualized funding APR (%) of every cell
+    apr = rates * (HOURS_PER_YEAR / intervals) * 100
+    # spreads[s, long, short] = apr[s, short] - apr[s, long]
+    spreads = apr[:, None, :] - apr[:, :, None]
+    invalid = np.isnan(spreads) | np.eye(len(names), dtype=bool)[None, :, :]
+    spreads[invalid] = -np.inf
+    # Best pair per symbol
+    flat = spreads.reshape(len(symbols), -1)
+    best_pair = flat.argmax(axis=1)
+    best_apr = flat[np.arange(len(symbols)), best_pair]
+    candidates = np.flatnonzero(np.isfinite(best_apr))
+    if candidates.size == 0:
+        return []
+    # Top-k by partial sort, then order only those k
+    if candidates.size > k:
+        candidates = candidates[np.argpartition(-best_apr[candidates], k - 1)[:k]]
+    candidates = candidates[np.argsort(-best_apr[candidates], kind="stable")]
+
+    table = []
+    for i in candidates:
+        long_i, short_i = divmod(int(best_pair[i]), len(names))
+        table.append({
+            "symbol": symbols[i],
+            "long_exchange": f"{names[long_i]} ({rates[i, long_i]:.6%})",
+            "short_exchange": f"{names[short_i]} ({rates[i, short_i]:.6%})",
+            "apr": float(best_apr[i])
+        })
+    return table
@@ -0,0 +1,203 @@
+# Historical Funding Backfill and Carry Backtest
+import asyncio
+import time
+from collections import defaultdict
+
+import db_manager
+from metrics import timed_call
+
+# Maximum concurrent history requests per exchange (ccxt's rate limiter still paces each client)
+BACKFILL_CONCURRENCY = 4
+
+# Maximum records per history request, as documented by each exchange
+PAGE_LIMITS = {"binance": 1000, "bybit": 200, "okx": 100}
+DEFAULT_PAGE_LIMIT = 100
+
+# Exchanges whose history is paged newest first (see page_backward), with the ccxt parameter bounding
+# each page from above and the offset applied to the cursor: OKX's `after` excludes it, `until` (Bybit's
+# endTime) includes it
+BACKWARD_PAGING = {"okx": ("after", 0), "bybit": ("until", -1)}
+
+
+async def page_forward(ex, symbol, since, until, limit):
+    """
+    Pages through settled funding from `since` to `until` (epoch seconds), oldest first, for
+    exchanges that return the oldest records from `since` onwards (Binance).
+    Yields (payments [(ts, rate)], reached): `reached` is how far the history is now covered.
+    """
+    while since <= until:
+        page = await timed_call(ex, 'fetch_funding_rate_history', symbol, since * 1000, limit)
+        timestamps = [entry["timestamp"] for entry in page if entry.get("timestamp")]
+        payments = settled_payments(page, since, until)
+        if len(timestamps) < limit or max(timestamps) // 1000 >= until:
+            # Short page: nothing newer is listed, so the whole window is covered
+            yield payments, until
+            return
+        since = max(timestamps) // 1000 + 1
+        yield payments, since - 1
+
+
+async def page_backward(ex, symbol, since, until, limit, cursor_param="after", offset=0):
+    """
+    Pages through settled funding from `until` down to `since` (epoch seconds), newest first,
+    for exchanges whose `since` does not select the oldest page (OKX maps it to a cursor that
+    returns the newest records; Bybit caps each request to a window after `since` and returns
+    the newest records of it). Each page asks for the newest records older than a cursor.
+    Yields (payments [(ts, rate)], reached): `reached` is how far down the history is now covered.
+    """
+    cursor = (until + 1) * 1000
+    while True:
+        page = await timed_call(
+            ex, 'fetch_funding_rate_history', symbol, None, limit, {cursor_param: cursor + offset}
+        )
+        timestamps = [entry["timestamp"] for entry in page if entry.get("timestamp")]
+        if len(timestamps) < limit or min(timestamps) // 1000 <= since:
+            # Short page: nothing older is listed, so the whole window is covered
+            yield settled_payments(page, since, until), since
+            return
+        cursor = min(timestamps)
+        yield settled_payments(page, since, until), cursor // 1000
+
+
+def settled_payments(page, since, until):
+    return sorted(
+        (entry["timestamp"] // 1000, entry["fundingRate"]) for entry in page
+        if entry.get("timestamp") and entry.get("fundingRate") is not None
+        and since <= entry["timestamp"] // 1000 <= until
+    )
+
+
+async def backfill_symbol(name, ex, symbol, start, until, covered, semaphore):
+    """
+    Backfills the settled funding history of one symbol on one exchange between `start` and
+    `until` (epoch seconds), storing each page and the covered range as it arrives.
+    `covered` is the (first, last) range stored by earlier runs, or None; only the parts of
+    [start, until] outside it are fetched, so widening the range fills the older gap too.
+    Returns the number of payments stored.
+    """
+    limit = PAGE_LIMITS.get(name, DEFAULT_PAGE_LIMIT)
+    backward = name in BACKWARD_PAGING
+    first, last = covered or (None, None)
+    gaps = [(start, until)] if covered is None else [(start, first - 1), (last + 1, until)]
+    stored = 0
+    async with semaphore:
+        for since, end in gaps:
+            if since > end:
+                continue
+            # Pages only extend the covered range while paging away from it (forward above it,
+            # backward below it); a gap filled in the other direction is recorded once complete
+            extends_up = not backward and (first is None or since == last + 1)
+            extends_down = backward and (first is None or end == first - 1)
+            if backward:
+                pages = page_backward(ex, symbol, since, end, limit, *BACKWARD_PAGING[name])
+            else:
+                pages = page_forward(ex, symbol, since, end, limit)
+            async for payments, reached in pages:
+                if extends_up:
+                    first, last = since if first is None else first, reached
+                elif extends_down:
+                    first, last = reached, end if last is None else last
+                await asyncio.to_thread(db_manager.save_funding_payments, name, symbol, payments, first, last)
+                stored += len(payments)
+            first = since if first is None else min(first, since)
+            last = end if last is None else max(last, end)
+            await asyncio.to_thread(db_manager.save_funding_payments, name, symbol, [], first, last)
+    return stored
+
+
+class Backfill:
+    """
+    Backfills settled funding rates for the whole common-symbol universe on every exchange.
+    Exchanges run in parallel with bounded per-exchange concurrency, pages are bulk-written
+    as they arrive, and per-(exchange, symbol) checkpoints let an interrupted run resume.
+    """
+
+    def __init__(self, collector, concurrency=BACKFILL_CONCURRENCY):
+        self.collector = collector
+        self.concurrency = concurrency
+        self.status = {"state": "idle"}
+        self._task = None
+
+    def start(self, days):
+        """
+        Starts a backfill of the last `days` days, unless one is already running.
+        """
+        if self._task is None or self._task.done():
+            self.status = {"state": "running", "days": days}
+            self._task = asyncio.create_task(self.run(days))
+        return self.status
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def run(self, days):
+        now = int(time.time())
+        start = now - int(days * 86400)
+        self.status = {"state": "running", "days": days, "started_at": db_manager.format_ts(now),
+                       "total": 0, "completed": 0, "payments": 0, "errors": 0}
+        try:
+            if self.collector.market_data is None:
+                await self.collector.refresh()
+            symbols = self.collector.market_data["symbols"]
+            checkpoints = await asyncio.to_thread(db_manager.get_backfill_checkpoints)
+            jobs = []
+            for name, ex in self.collector.exchanges.items():
+                semaphore = asyncio.Semaphore(self.concurrency)
+                for symbol in symbols:
+                    jobs.append(self._run_job(name, ex, symbol, start, now, checkpoints.get((name, symbol)), semaphore))
+            self.status["total"] = len(jobs)
+            await asyncio.gather(*jobs)
+            self.status["state"] = "done"
+        except asyncio.CancelledError:
+            self.status["state"] = "cancelled"
+            raise
+        except Exception as e:
+            self.status.update(state="failed", error=str(e))
+        self.status["finished_at"] = db_manager.format_ts(time.time())
+
+    async def _run_job(self, name, ex, symbol, start, until, covered, semaphore):
+        try:
+            stored = await backfill_symbol(name, ex, symbol, start, until, covered, semaphore)
+            self.status["payments"] += stored
+        except Exception as e:
+            # Keep going; the checkpoint lets the next run retry from where this one stopped
+            self.status["errors"] += 1
+            print(f"[backfill] {name} {symbol} failed: {e}")
+        self.status["completed"] += 1
+
+
+def compute_carry(symbol, long_exchange, short_exchange, start, end):
+    """
+    Computes the realized funding carry of holding a long perpetual on `long_exchange` and a
+    short on `short_exchange` between two epoch timestamps, from backfilled settlements.
+    The short leg receives each funding payment on its exchange and the long leg pays it, so
+    carry = sum(short rates) - sum(long rates). Price PnL and fees are not included.
+    """
+    long_payments = db_manager.get_funding_payments(long_exchange, symbol, start, end)
+    short_payments = db_manager.get_funding_payments(short_exchange, symbol, start, end)
+    # Daily carry contributions, in percent
+    daily = defaultdict(float)
+    for ts, rate in short_payments:
+        daily[ts // 86400] += rate * 100
+    for ts, rate in long_payments:
+        daily[ts // 86400] -= rate * 100
+    series = []
+    cumulative = 0.0
+    for day in sorted(daily):
+        cumulative += daily[day]
+        series.append({"date": time.strftime("%Y-%m-%d", time.gmtime(day * 86400)), "carry_pct": cumulative})
+    days = max((end - start) / 86400, 1e-9)
+    return {
+        "symbol": symbol,
+        "long_exchange": long_exchange,
+        "short_exchange": short_exchange,
+        "from": db_manager.format_ts(start),
+        "to": db_manager.format_ts(end),
+        "long_payments": len(long_payments),
+        "short_payments": len(short_payments),
+        "carry_pct": cumulative,
+        "apr": cumulative * 365 / days,
+        "series": series,
+    }
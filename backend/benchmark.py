@@ -0,0 +1,142 @@
+# API Benchmark Suite (runs offline against mock exchanges)
+"""
+Measures the API without touching live exchanges:
+
+    python benchmark.py --universe 300 --latency-ms 80 --clients 50 --duration 5
+
+Reports cold/warm endpoint latency, requests per second under concurrent clients,
+exchange calls per refresh and history query time as the database grows.
+"""
+import argparse
+import asyncio
+import importlib
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def report(name, samples):
+    """
+    Prints p50/p95/max latency (ms) of a list of durations in seconds.
+    """
+    ms = [s * 1000 for s in samples]
+    print(f"  {name:<40} p50 {percentile(ms, 50):8.2f} ms   p95 {percentile(ms, 95):8.2f} ms   max {max(ms):8.2f} ms")
+
+
+async def timed_get(client, url, **params):
+    start = time.perf_counter()
+    response = await client.get(url, params=params)
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def bench_latency(client, endpoints, requests):
+    print("Warm latency (sequential requests)")
+    for url in endpoints:
+        report(url, [await timed_get(client, url) for _ in range(requests)])
+
+
+async def bench_throughput(client, endpoints, clients, duration):
+    print(f"Throughput ({clients} concurrent clients, {duration}s per endpoint)")
+    for url in endpoints:
+        deadline = time.perf_counter() + duration
+        samples = []
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                samples.append(await timed_get(client, url))
+        await asyncio.gather(*[worker() for _ in range(clients)])
+        print(f"  {url:<40} {len(samples) / duration:10.1f} req/s   p95 {percentile(samples, 95) * 1000:8.2f} ms")
+
+
+async def bench_refresh(main, refreshes):
+    print(f"Collector refresh ({refreshes} passes)")
+    durations = []
+    calls = []
+    for _ in range(refreshes):
+        before = sum(sum(ex.calls.values()) for ex in main.collector.exchanges.values())
+        start = time.perf_counter()
+        await main.collector.refresh()
+        durations.append(time.perf_counter() - start)
+        calls.append(sum(sum(ex.calls.values()) for ex in main.collector.exchanges.values()) - before)
+    report("refresh duration", durations)
+    print(f"  {'exchange calls per refresh':<40} {statistics.mean(calls):8.1f}")
+
+
+async def bench_history(main, client, history_sizes):
+    print("History queries as the database grows")
+    db_manager = main.db_manager
+    market_data = main.collector.market_data
+    arbitrage = main.collector.snapshots['arbitrage'][0]
+    symbol = market_data["symbols"][0]
+    stored = 0
+    now = int(time.time())
+    for size in history_sizes:
+        start = time.perf_counter()
+        while stored < size:
+            # Older snapshots, 5 minutes apart, so retention and rollups see realistic timestamps
+            db_manager.save_refresh(market_data, arbitrage, ts=now - (size - stored) * 300)
+            stored += 1
+        write = time.perf_counter() - start
+        print(f"  {size} snapshots (writes took {write:.2f}s)")
+        report("/api/history/arbitrage?limit=50", [await timed_get(client, "/api/history/arbitrage", limit=50) for _ in range(20)])
+        report("/api/history/funding?limit=10", [await timed_get(client, "/api/history/funding", limit=10) for _ in range(20)])
+        report("/api/history/arbitrage/hourly", [await timed_get(client, "/api/history/arbitrage/hourly") for _ in range(20)])
+        report("/api/symbol-history", [await timed_get(client, "/api/symbol-history", symbol=symbol) for _ in range(20)])
+
+
+async def run(args):
+    import httpx
+    main = importlib.import_module("main")
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            endpoints = ["/api/common-funding-table", "/api/top-arbitrage"]
+            print("Cold latency (first request, empty snapshot)")
+            for url in endpoints:
+                report(url, [await timed_get(client, url)])
+            await bench_latency(client, endpoints + ["/api/perp-symbols", "/api/history/arbitrage"], args.requests)
+            await bench_throughput(client, endpoints, args.clients, args.duration)
+            await bench_refresh(main, args.refreshes)
+            await bench_history(main, client, args.history)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--universe", type=int, default=200, help="common symbols per mock exchange")
+    parser.add_argument("--latency-ms", type=float, default=50, help="mean mock exchange latency")
+    parser.add_argument("--jitter-ms", type=float, default=20, help="mock exchange latency jitter")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of mock calls that fail")
+    parser.add_argument("--clients", type=int, default=50, help="concurrent clients for the throughput test")
+    parser.add_argument("--duration", type=float, default=3, help="seconds per throughput test")
+    parser.add_argument("--requests", type=int, default=200, help="sequential requests per latency test")
+    parser.add_argument("--refreshes", type=int, default=3, help="collector refreshes to measure")
+    parser.add_argument("--history", type=int, nargs="+", default=[100, 1000, 3000],
+                        help="database sizes (snapshots) at which to time history queries")
+    args = parser.parse_args()
+
+    # Configure the app before it is imported: mock exchanges, no streaming, throwaway database and market cache
+    workdir = tempfile.mkdtemp()
+    os.environ.update({
+        "FUNDING_EXCHANGE_MODE": "mock",
+        "FUNDING_STREAMING": "0",
+        "FUNDING_DB_PATH": os.path.join(workdir, "bench.db"),
+        "FUNDING_MARKETS_CACHE": os.path.join(workdir, "market_cache.json"),
+        "MOCK_UNIVERSE_SIZE": str(args.universe),
+        "MOCK_LATENCY_MS": str(args.latency_ms),
+        "MOCK_JITTER_MS": str(args.jitter_ms),
+        "MOCK_ERROR_RATE": str(args.error_rate),
+    })
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
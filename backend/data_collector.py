@@ -0,0 +1,395 @@
+# Background Data Collector
+import asyncio
+import os
+import time
+
+import ccxt.async_support as ccxt_async
+
+from arbitrage_engine import DEFAULT_INTERVAL_HOURS, rank_arbitrage
+from market_index import MarketIndex
+from metrics import pipeline_stage_seconds, snapshot_requests, timed_call
+
+# Exchanges tracked by the collector, in the column order used by the frontend tables
+EXCHANGE_NAMES = ["binance", "bybit", "okx"]
+
+# How often the collector refreshes each snapshot (seconds)
+REFRESH_INTERVAL = 300
+
+# "live" uses real ccxt clients; "mock" serves synthetic data from mock_exchange (benchmarks, offline runs)
+EXCHANGE_MODE = os.environ.get("FUNDING_EXCHANGE_MODE", "live")
+
+# How long a worker that follows the collector worker waits for its first published snapshot (seconds)
+LEADER_WAIT_TIMEOUT = 30
+
+# Maximum concurrent per-symbol requests per exchange when no bulk endpoint is available
+PER_SYMBOL_CONCURRENCY = 10
+
+# Symbols whose full funding rate structures are kept from each pass (served by /api/funding-rates)
+MAJOR_SYMBOLS = ["BTC/USDT:USDT", "ETH/USDT:USDT"]
+
+
+def create_exchanges():
+    """
+    Creates one long-lived async ccxt client per supported exchange.
+    Clients are reused across refreshes so markets and HTTP sessions are only set up once.
+    """
+    if EXCHANGE_MODE == "mock":
+        from mock_exchange import create_mock_exchanges
+        return create_mock_exchanges(EXCHANGE_NAMES)
+    return {name: getattr(ccxt_async, name)({"enableRateLimit": True}) for name in EXCHANGE_NAMES}
+
+
+async def timed_stage(stage, awaitable):
+    """
+    Awaits one step of a collection pass, recording its duration under the given stage name.
+    """
+    with pipeline_stage_seconds.time(stage=stage):
+        return await awaitable
+
+
+def parse_interval_hours(interval):
+    """
+    Converts a ccxt funding interval string (e.g., "8h") to hours, or None if unknown.
+    """
+    if not interval:
+        return None
+    try:
+        return float(interval[:-1]) if interval.endswith('h') else float(interval)
+    except ValueError:
+        return None
+
+
+async def fetch_rate(ex, symbol):
+    """
+    Fetches the current funding rate of one symbol, returning None if the exchange call fails.
+    """
+    try:
+        return await timed_call(ex, 'fetch_funding_rate', symbol)
+    except Exception:
+        return None
+
+
+async def fetch_funding_universe(ex, symbols):
+    """
+    Fetches the funding rates of all given symbols on one exchange.
+    Uses the exchange's bulk endpoint (one request) when available, otherwise falls back
+    to per-symbol requests with bounded concurrency.
+    Returns a dictionary of symbol -> ccxt funding rate structure.
+    """
+    if ex.has.get("fetchFundingRates"):
+        try:
+            rates = await timed_call(ex, 'fetch_funding_rates', symbols)
+            return {s: rates[s] for s in symbols if s in rates}
+        except Exception as e:
+            print(f"[collector] {ex.id} bulk funding fetch failed, falling back to per-symbol: {e}")
+    semaphore = asyncio.Semaphore(PER_SYMBOL_CONCURRENCY)
+
+    async def bounded_fetch(symbol):
+        async with semaphore:
+            return await fetch_rate(ex, symbol)
+    results = await asyncio.gather(*[bounded_fetch(symbol) for symbol in symbols])
+    return {s: r for s, r in zip(symbols, results) if r is not None}
+
+
+def market_interval_hours(market):
+    """
+    Returns the funding interval in hours listed in a market's raw exchange info, or None.
+    Bybit lists it as `fundingInterval` in minutes on every linear contract.
+    """
+    try:
+        minutes = float(((market or {}).get("info") or {}).get("fundingInterval"))
+    except (TypeError, ValueError):
+        return None
+    return minutes / 60 if minutes > 0 else None
+
+
+async def fetch_intervals(ex, funding, known=None, markets=None):
+    """
+    Returns the funding interval in hours of every symbol in `funding` (symbol -> funding rate structure).
+    Intervals the bulk funding endpoint omits (Binance, Bybit) are taken from `known` (symbol -> hours,
+    from the market index), then from the market metadata (`markets`: symbol -> ccxt market; Bybit
+    lists the interval there), or else fetched in one extra call. That call (Binance's fundingInfo)
+    only lists symbols whose interval differs from the default, so the symbols it omits get the
+    default 8h and are known from then on; if it fails they are left as None.
+    """
+    known = known or {}
+    markets = markets or {}
+    intervals = {
+        s: parse_interval_hours(r.get("interval")) or known.get(s) or market_interval_hours(markets.get(s))
+        for s, r in funding.items()
+    }
+    missing = [s for s, interval in intervals.items() if interval is None]
+    if missing and ex.has.get("fetchFundingIntervals"):
+        try:
+            fetched = await timed_call(ex, 'fetch_funding_intervals', missing)
+            for symbol in missing:
+                interval = parse_interval_hours((fetched.get(symbol) or {}).get("interval"))
+                intervals[symbol] = interval or DEFAULT_INTERVAL_HOURS
+        except Exception as e:
+            print(f"[collector] {ex.id} funding intervals fetch failed: {e}")
+    return intervals
+
+
+async def fetch_volumes(ex, symbols):
+    """
+    Fetches the 24h quote volume of all given symbols on one exchange in a single tickers call.
+    Returns a dictionary of symbol -> quote volume (0 when unknown).
+    """
+    try:
+        tickers = await timed_call(ex, 'fetch_tickers', symbols)
+    except Exception as e:
+        print(f"[collector] {ex.id} tickers fetch failed: {e}")
+        tickers = {}
+    return {s: (tickers.get(s) or {}).get("quoteVolume") or 0 for s in symbols}
+
+
+async def collect_market_data(exchanges, index):
+    """
+    Runs one data-collection pass shared by every table: the funding rates of every symbol of the
+    common universe (from the market index) on every exchange and the Binance 24h quote volumes.
+    All exchanges are queried concurrently, so a pass takes about one exchange round-trip.
+    """
+    symbols = index.common
+    names = list(exchanges.keys())
+    results = await asyncio.gather(
+        timed_stage("volumes", fetch_volumes(exchanges["binance"], symbols)),
+        *[timed_stage("funding", fetch_funding_universe(exchanges[name], symbols)) for name in names]
+    )
+    volumes, funding = results[0], dict(zip(names, results[1:]))
+    intervals = await timed_stage("intervals", asyncio.gather(
+        *[
+            fetch_intervals(exchanges[name], funding[name], index.intervals.get(name), index.markets.get(name))
+            for name in names
+        ]
+    ))
+    for name, known in zip(names, intervals):
+        index.update_intervals(name, known)
+    return {
+        "symbols": symbols,
+        "exchanges": names,
+        "volumes": volumes,
+        "rates": {name: {s: r.get("fundingRate") for s, r in funding[name].items()} for name in names},
+        "intervals": dict(zip(names, intervals)),  # funding interval in hours, None when unknown
+        # Full ccxt funding rate structures (mark/index price, next funding time, ...) of the major symbols
+        "major_rates": {name: {s: funding[name][s] for s in MAJOR_SYMBOLS if s in funding[name]} for name in names},
+    }
+
+
+def build_funding_table(market_data):
+    """
+    Builds the funding rate comparison table for the top 50 common symbols by Binance 24h quote volume.
+    """
+    volumes = market_data["volumes"]
+    top_symbols = sorted(market_data["symbols"], key=lambda s: float(volumes[s]), reverse=True)[:50]
+    table = []
+    for symbol in top_symbols:
+        row = {"symbol": symbol, "Volume (Binance)": volumes[symbol]}
+        for name in market_data["exchanges"]:
+            row[name] = market_data["rates"][name].get(symbol)
+        table.append(row)
+    return table
+
+
+def build_arbitrage_table(market_data):
+    """
+    Builds the top 10 arbitrage opportunities (by annualized APR) across the common symbols.
+    """
+    return rank_arbitrage(market_data, k=10)
+
+
+class DataCollector:
+    """
+    Owns the exchange clients and keeps an in-memory snapshot of every data type fresh.
+    Endpoints read snapshots without touching the exchanges; refreshes run on a schedule
+    and are coalesced so at most one collection pass is ever in flight. One pass feeds
+    every data type.
+    """
+
+    def __init__(self, on_refresh=None, interval=REFRESH_INTERVAL, exchange_factory=create_exchanges, index=None):
+        self.builders = {
+            "funding": build_funding_table,
+            "arbitrage": build_arbitrage_table,
+        }
+        self.on_refresh = on_refresh  # called with (market_data, tables) after each pass, e.g. to store history
+        self.interval = interval
+        self.exchange_factory = exchange_factory
+        self.exchanges = {}
+        self.index = index or MarketIndex(tag=EXCHANGE_MODE)  # cached markets and symbol universe
+        self.market_data = None  # result of the latest collect_market_data() pass
+        self.snapshots = {}      # data_type -> (data, updated_at epoch seconds)
+        self.versions = {}       # data_type -> counter bumped whenever the snapshot data changes
+        self.following = False   # True in workers that install snapshots published by the collector worker
+        self._inflight = None    # running collection task, shared by all callers
+        self._loop_task = None
+
+    async def start(self):
+        """
+        Warm-loads the market index, creates the exchange clients (with the cached markets
+        installed) and starts the periodic refresh loop.
+        """
+        if await asyncio.to_thread(self.index.load):
+            print(f"[collector] loaded {len(self.index.common)} common symbols from {self.index.path}")
+        self.exchanges = self.exchange_factory()
+        self.index.seed(self.exchanges)
+        self._loop_task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stops the refresh loop and closes all exchange clients.
+        """
+        if self._loop_task:
+            self._loop_task.cancel()
+            await asyncio.gather(self._loop_task, return_exceptions=True)
+        if self._inflight:
+            self._inflight.cancel()
+            await asyncio.gather(self._inflight, return_exceptions=True)
+        await self.index.cancel()
+        # Always close all async exchange clients to avoid resource warnings
+        await asyncio.gather(*[ex.close() for ex in self.exchanges.values()], return_exceptions=True)
+
+    def seed(self, data_type, data, updated_at):
+        """
+        Installs a previously stored snapshot (e.g., loaded from the database at startup).
+        """
+        if data is not None and data_type not in self.snapshots:
+            self._publish(data_type, data, updated_at)
+
+    def refresh(self):
+        """
+        Starts a collection pass, or joins the one already in flight (single-flight).
+        Returns an awaitable that resolves once every snapshot has been updated.
+        Following workers never fetch; they wait for the collector worker to publish instead.
+        """
+        if self._inflight is None:
+            self._inflight = asyncio.create_task(self._wait_for_leader() if self.following else self._refresh())
+            self._inflight.add_done_callback(self._clear_inflight)
+        return asyncio.shield(self._inflight)
+
+    def _clear_inflight(self, task):
+        if self._inflight is task:
+            self._inflight = None
+
+    async def get_index(self):
+        """
+        Returns the market index, loading the markets first if neither the cache nor a
+        previous refresh has provided them.
+        """
+        if not self.index.common:
+            if self.following:
+                await self.refresh()
+            else:
+                await timed_stage("markets", self.index.refresh(self.exchanges))
+        return self.index
+
+    async def _wait_for_leader(self):
+        deadline = time.time() + LEADER_WAIT_TIMEOUT
+        while self.market_data is None:
+            if time.time() > deadline:
+                raise RuntimeError("no snapshot has been published by the collector worker yet")
+            await asyncio.sleep(0.1)
+
+    async def _refresh(self):
+        with pipeline_stage_seconds.time(stage="refresh"):
+            index = await self.get_index()
+            if not index.common:
+                raise RuntimeError("no common perpetual symbols: market metadata could not be loaded")
+            if not index.is_fresh():
+                # Stale listings are still usable; reload them without holding up this pass
+                index.refresh(self.exchanges)
+            market_data = await collect_market_data(self.exchanges, index)
+            now = time.time()
+            self.market_data = market_data
+            tables = {}
+            for data_type, builder in self.builders.items():
+                with pipeline_stage_seconds.time(stage=f"build_{data_type}"):
+                    tables[data_type] = builder(market_data)
+            for data_type, data in tables.items():
+                self._publish(data_type, data, now)
+            if self.on_refresh:
+                # Storage is blocking I/O, so keep it off the event loop
+                await timed_stage("store", asyncio.to_thread(self.on_refresh, market_data, tables))
+            if index.dirty:
+                await asyncio.to_thread(index.save)
+
+    def _publish(self, data_type, data, updated_at):
+        self.snapshots[data_type] = (data, updated_at)
+        self.versions[data_type] = self.versions.get(data_type, 0) + 1
+
+    def export_state(self):
+        """
+        Returns everything other workers need to serve requests: the snapshots, the latest
+        collection pass and the listings of the market index.
+        """
+        return {
+            "snapshots": self.snapshots,
+            "market_data": self.market_data,
+            "index": self.index.summary(),
+        }
+
+    def install(self, state):
+        """
+        Installs state exported by the collector worker (see export_state()).
+        """
+        self.market_data = state["market_data"]
+        for data_type, (data, updated_at) in state["snapshots"].items():
+            self._publish(data_type, data, updated_at)
+        self.index.install(state["index"])
+
+    def apply_rates(self, updates):
+        """
+        Applies live funding rate updates ({exchange: {symbol: rate}}) to the latest collection
+        pass and rebuilds the in-memory tables. Returns the set of symbols whose rate changed.
+        Snapshot timestamps are left untouched so the periodic REST pass (volumes, listings,
+        stored history) keeps its schedule.
+        """
+        if self.market_data is None:
+            return set()
+        universe = set(self.market_data["symbols"])
+        changed = set()
+        for name, rates in updates.items():
+            book = self.market_data["rates"].get(name)
+            if book is None:
+                continue
+            for symbol, rate in rates.items():
+                if symbol in universe and book.get(symbol) != rate:
+                    book[symbol] = rate
+                    changed.add(symbol)
+                    if symbol in self.market_data["major_rates"].get(name, {}):
+                        self.market_data["major_rates"][name][symbol]["fundingRate"] = rate
+        if changed:
+            for data_type, builder in self.builders.items():
+                self._publish(data_type, builder(self.market_data), self.snapshots[data_type][1])
+        return changed
+
+    async def get(self, data_type):
+        """
+        Returns the latest snapshot of the given data type.
+        Only waits on the exchanges if no snapshot has been collected yet.
+        """
+        if data_type in self.snapshots:
+            snapshot_requests.inc(data_type=data_type, result="hit")
+        else:
+            snapshot_requests.inc(data_type=data_type, result="miss")
+            await self.refresh()
+        return self.snapshots[data_type][0]
+
+    def age(self, data_type):
+        """
+        Returns how many seconds old the current snapshot is, or None if there is none.
+        """
+        snapshot = self.snapshots.get(data_type)
+        return None if snapshot is None else time.time() - snapshot[1]
+
+    async def _run(self):
+        # Refresh whenever any snapshot is missing or older than the interval, and once at startup
+        # when the snapshots were only seeded from the database (no collection pass to stream into yet)
+        while True:
+            ages = [self.age(data_type) for data_type in self.builders]
+            if self.market_data is None or any(age is None or age >= self.interval for age in ages):
+                try:
+                    await self.refresh()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"[collector] refresh failed: {e}")
+            await asyncio.sleep(min(self.interval, 30))
@@ -0,0 +1,551 @@
+# SQLite History Store
+import calendar
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from data_collector import build_funding_table
+from metrics import timed_db
+
+# Database file, overridable for deployments and benchmarks
+DB_PATH = os.environ.get("FUNDING_DB_PATH", "funding_history.db")
+
+# Snapshots younger than this are kept at full resolution (days)
+RETENTION_DAYS = float(os.environ.get("HISTORY_RETENTION_DAYS", "7"))
+# Older snapshots are downsampled to one per bucket of this size (seconds)
+DOWNSAMPLE_SECONDS = int(os.environ.get("HISTORY_DOWNSAMPLE_SECONDS", "3600"))
+# Snapshots older than this are deleted entirely (days, 0 keeps everything)
+MAX_AGE_DAYS = float(os.environ.get("HISTORY_MAX_AGE_DAYS", "365"))
+# Minimum time between two retention passes (seconds)
+PRUNE_INTERVAL = 3600
+# Snapshots deleted per statement by a retention pass (kept under SQLite's bound-parameter limit)
+PRUNE_BATCH_SIZE = 500
+# Arbitrage rollup bucket sizes maintained on every insert, as "name=seconds" pairs
+ROLLUP_BUCKETS = dict(
+    (name, int(seconds)) for name, seconds in
+    (pair.split('=') for pair in os.environ.get("ROLLUP_BUCKETS", "hour=3600,day=86400").split(','))
+)
+# Number of buckets returned by the rollup endpoint when no range is given
+ROLLUP_DEFAULT_BUCKETS = 48
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS snapshot (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        data_type TEXT NOT NULL,
+        ts INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_snapshot_type_ts ON snapshot (data_type, ts);
+    CREATE INDEX IF NOT EXISTS idx_snapshot_type_id ON snapshot (data_type, id);
+
+    CREATE TABLE IF NOT EXISTS funding_rate (
+        snapshot_id INTEGER NOT NULL,
+        ts INTEGER NOT NULL,
+        exchange TEXT NOT NULL,
+        symbol TEXT NOT NULL,
+        funding_rate REAL,
+        funding_interval REAL,
+        volume REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_funding_rate_symbol ON funding_rate (symbol, exchange, ts);
+    CREATE INDEX IF NOT EXISTS idx_funding_rate_snapshot ON funding_rate (snapshot_id);
+
+    CREATE TABLE IF NOT EXISTS arbitrage_opportunity (
+        snapshot_id INTEGER NOT NULL,
+        ts INTEGER NOT NULL,
+        rank INTEGER NOT NULL,
+        symbol TEXT NOT NULL,
+        long_exchange TEXT NOT NULL,
+        long_rate REAL,
+        short_exchange TEXT NOT NULL,
+        short_rate REAL,
+        apr REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_arbitrage_snapshot ON arbitrage_opportunity (snapshot_id, rank);
+    CREATE INDEX IF NOT EXISTS idx_arbitrage_symbol ON arbitrage_opportunity (symbol, ts);
+
+    CREATE TABLE IF NOT EXISTS arbitrage_rollup (
+        bucket_size INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        top_symbol TEXT,
+        max_apr REAL,
+        min_apr REAL,
+        sum_apr REAL NOT NULL DEFAULT 0,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (bucket_size, bucket)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS funding_payment (
+        exchange TEXT NOT NULL,
+        symbol TEXT NOT NULL,
+        ts INTEGER NOT NULL,
+        funding_rate REAL NOT NULL,
+        PRIMARY KEY (exchange, symbol, ts)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS backfill_checkpoint (
+        exchange TEXT NOT NULL,
+        symbol TEXT NOT NULL,
+        first_ts INTEGER NOT NULL,
+        last_ts INTEGER NOT NULL,
+        PRIMARY KEY (exchange, symbol)
+    ) WITHOUT ROWID;
+'''
+
+_conn = None
+_lock = threading.Lock()       # serializes writes on the shared write connection
+_readers = threading.local()   # one read connection per thread
+_reader_conns = []             # every read connection opened, so close_db() can close them
+_readers_lock = threading.Lock()
+_generation = 0                # bumped by close_db() so threads reopen their read connection
+_last_prune = 0
+
+
+def get_db():
+    """
+    Returns the shared write connection, opening it in WAL mode on first use.
+    It is used by the collector, the backfill and startup migrations; writes are serialized with a lock.
+    """
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        _conn.execute('PRAGMA journal_mode=WAL')
+        _conn.execute('PRAGMA synchronous=NORMAL')
+    return _conn
+
+
+def get_reader():
+    """
+    Returns the calling thread's read-only connection, opening it on first use.
+    In WAL mode readers see the last committed state and never wait on the writer, so
+    request threads keep serving history while a refresh is being stored or pruned.
+    """
+    conn = getattr(_readers, "conn", None)
+    if conn is None or _readers.generation != _generation:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        conn.execute('PRAGMA query_only=ON')
+        _readers.conn, _readers.generation = conn, _generation
+        with _readers_lock:
+            _reader_conns.append(conn)
+    return conn
+
+
+def close_db():
+    """
+    Closes the write connection and every read connection (called on application shutdown).
+    """
+    global _conn, _generation
+    with _lock:
+        if _conn is not None:
+            _conn.close()
+            _conn = None
+    with _readers_lock:
+        for conn in _reader_conns:
+            conn.close()
+        _reader_conns.clear()
+        _generation += 1
+
+
+def format_ts(ts):
+    """
+    Formats an epoch timestamp the way snapshots have always been reported ("YYYY-MM-DD HH:MM:SS", UTC).
+    """
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(ts))
+
+
+def parse_exchange_label(label):
+    """
+    Splits an arbitrage label such as "binance (0.012345%)" into ("binance", 0.00012345).
+    """
+    name, _, rest = label.partition(' (')
+    try:
+        rate = float(rest.rstrip(')').rstrip('%')) / 100
+    except ValueError:
+        rate = None
+    return name, rate
+
+
+def init_db(maintenance=True):
+    """
+    Creates the schema if needed and migrates snapshots from the legacy JSON table.
+    With maintenance=False (workers that only read the database) the migration and the
+    rollup rebuild are left to the collector worker.
+    """
+    with _lock:
+        conn = get_db()
+        conn.executescript(SCHEMA)
+        if maintenance:
+            migrate_legacy_snapshots(conn)
+            rebuild_rollups(conn)
+
+
+def migrate_legacy_snapshots(conn):
+    """
+    Converts rows of the old `funding_snapshot` table (one JSON blob per table) into the
+    normalized schema, then renames the old table to `funding_snapshot_legacy` so the
+    migration only runs once. The legacy table can be dropped once the data is verified.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='funding_snapshot'"
+    ).fetchone()
+    if not exists:
+        return
+    rows = conn.execute('SELECT created_at, data_type, data FROM funding_snapshot ORDER BY id').fetchall()
+    with conn:
+        for created_at, data_type, data in rows:
+            ts = calendar.timegm(time.strptime(created_at, "%Y-%m-%d %H:%M:%S"))
+            try:
+                table = json.loads(data)
+            except (TypeError, ValueError):
+                continue
+            if data_type == 'funding':
+                _insert_funding_table(conn, ts, table)
+            elif data_type == 'arbitrage':
+                _insert_arbitrage(conn, ts, table)
+        conn.execute('ALTER TABLE funding_snapshot RENAME TO funding_snapshot_legacy')
+    print(f"[db] migrated {len(rows)} legacy snapshots")
+
+
+def _insert_snapshot(conn, data_type, ts):
+    return conn.execute('INSERT INTO snapshot (data_type, ts) VALUES (?, ?)', (data_type, ts)).lastrowid
+
+
+def _insert_funding_table(conn, ts, table):
+    # Legacy funding tables only hold the top-50 rows with one rate column per exchange
+    snapshot_id = _insert_snapshot(conn, 'funding', ts)
+    rows = []
+    for row in table:
+        for name, rate in row.items():
+            if name in ('symbol', 'Volume (Binance)'):
+                continue
+            volume = row.get('Volume (Binance)') if name == 'binance' else None
+            rows.append((snapshot_id, ts, name, row['symbol'], rate, None, volume))
+    conn.executemany('INSERT INTO funding_rate VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+
+
+def _insert_arbitrage(conn, ts, table):
+    snapshot_id = _insert_snapshot(conn, 'arbitrage', ts)
+    rows = []
+    for rank, row in enumerate(table):
+        long_ex, long_rate = parse_exchange_label(row['long_exchange'])
+        short_ex, short_rate = parse_exchange_label(row['short_exchange'])
+        rows.append((snapshot_id, ts, rank, row['symbol'], long_ex, long_rate, short_ex, short_rate, row['apr']))
+    conn.executemany('INSERT INTO arbitrage_opportunity VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+    if table:
+        best = max(table, key=lambda x: x['apr'])
+        _update_rollups(conn, ts, best['symbol'], best['apr'])
+
+
+def _update_rollups(conn, ts, symbol, apr, bucket_sizes=None):
+    # Fold one snapshot's best opportunity into every rollup bucket it falls in
+    for bucket_size in bucket_sizes or ROLLUP_BUCKETS.values():
+        conn.execute('''
+            INSERT INTO arbitrage_rollup (bucket_size, bucket, top_symbol, max_apr, min_apr, sum_apr, count)
+            VALUES (?, ?, ?, ?, ?, ?, 1)
+            ON CONFLICT (bucket_size, bucket) DO UPDATE SET
+                top_symbol = CASE WHEN excluded.max_apr > max_apr THEN excluded.top_symbol ELSE top_symbol END,
+                max_apr = MAX(max_apr, excluded.max_apr),
+                min_apr = MIN(min_apr, excluded.min_apr),
+                sum_apr = sum_apr + excluded.sum_apr,
+                count = count + 1
+        ''', (bucket_size, ts // bucket_size * bucket_size, symbol, apr, apr, apr))
+
+
+def rebuild_rollups(conn):
+    """
+    Fills the rollups of every configured bucket size that has none from stored arbitrage rows
+    (e.g., on a database created before rollups existed, or after a size is added to
+    ROLLUP_BUCKETS). Afterwards rollups are maintained incrementally on insert.
+    """
+    missing = [
+        bucket_size for bucket_size in ROLLUP_BUCKETS.values()
+        if not conn.execute('SELECT 1 FROM arbitrage_rollup WHERE bucket_size=? LIMIT 1', (bucket_size,)).fetchone()
+    ]
+    if not missing:
+        return
+    # Tables are stored sorted by APR, so rank 0 is each snapshot's best opportunity
+    rows = conn.execute('''
+        SELECT ts, symbol, apr FROM arbitrage_opportunity WHERE rank = 0 AND apr IS NOT NULL ORDER BY ts
+    ''').fetchall()
+    with conn:
+        for ts, symbol, apr in rows:
+            _update_rollups(conn, ts, symbol, apr, missing)
+
+
+@timed_db("save_refresh")
+def save_refresh(market_data, arbitrage_table, ts=None):
+    """
+    Stores one collection pass in a single transaction: a row per (exchange, symbol) with its
+    funding rate, funding interval and volume, plus the ranked arbitrage table.
+    """
+    ts = int(ts if ts is not None else time.time())
+    volumes = market_data["volumes"]
+    with _lock:
+        conn = get_db()
+        with conn:
+            snapshot_id = _insert_snapshot(conn, 'funding', ts)
+            rows = []
+            for name in market_data["exchanges"]:
+                rates = market_data["rates"][name]
+                intervals = market_data["intervals"][name]
+                for symbol in market_data["symbols"]:
+                    # Only Binance volumes are collected today
+                    volume = volumes.get(symbol) if name == 'binance' else None
+                    rows.append((snapshot_id, ts, name, symbol, rates.get(symbol), intervals.get(symbol), volume))
+            conn.executemany('INSERT INTO funding_rate VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            _insert_arbitrage(conn, ts, arbitrage_table)
+        prune(conn, ts)
+
+
+@timed_db("prune")
+def prune(conn, now):
+    """
+    Applies the retention policy at most once per PRUNE_INTERVAL: snapshots older than
+    RETENTION_DAYS are downsampled to the first one per DOWNSAMPLE_SECONDS bucket, and
+    snapshots older than MAX_AGE_DAYS are removed.
+    """
+    global _last_prune
+    if now - _last_prune < PRUNE_INTERVAL:
+        return
+    _last_prune = now
+    downsample_before = now - RETENTION_DAYS * 86400
+    stale = {row[0] for row in conn.execute('''
+        SELECT id FROM snapshot WHERE ts < ? AND id NOT IN (
+            SELECT MIN(id) FROM snapshot WHERE ts < ? GROUP BY data_type, ts / ?
+        )
+    ''', (downsample_before, downsample_before, DOWNSAMPLE_SECONDS))}
+    if MAX_AGE_DAYS > 0:
+        stale.update(row[0] for row in conn.execute(
+            'SELECT id FROM snapshot WHERE ts < ?', (now - MAX_AGE_DAYS * 86400,)))
+    stale = sorted(stale)
+    with conn:
+        # Child rows are deleted by snapshot id, so each delete is an index lookup rather than a table scan
+        for i in range(0, len(stale), PRUNE_BATCH_SIZE):
+            batch = stale[i:i + PRUNE_BATCH_SIZE]
+            placeholders = ','.join('?' * len(batch))
+            for table in ('funding_rate', 'arbitrage_opportunity'):
+                conn.execute(f'DELETE FROM {table} WHERE snapshot_id IN ({placeholders})', batch)
+            conn.execute(f'DELETE FROM snapshot WHERE id IN ({placeholders})', batch)
+
+
+def _load_funding_tables(conn, snapshot_ids):
+    # Rebuild the top-50 funding table of each snapshot from its normalized rows
+    if not snapshot_ids:
+        return {}
+    placeholders = ','.join('?' * len(snapshot_ids))
+    rows = conn.execute(f'''
+        SELECT snapshot_id, exchange, symbol, funding_rate, funding_interval, volume
+        FROM funding_rate WHERE snapshot_id IN ({placeholders})
+    ''', snapshot_ids).fetchall()
+    market_data = {}
+    for snapshot_id, exchange, symbol, rate, interval, volume in rows:
+        data = market_data.setdefault(snapshot_id, {
+            "symbols": set(), "exchanges": [], "volumes": {}, "rates": {}, "intervals": {},
+        })
+        data["symbols"].add(symbol)
+        if exchange not in data["rates"]:
+            data["exchanges"].append(exchange)
+            data["rates"][exchange] = {}
+            data["intervals"][exchange] = {}
+        data["rates"][exchange][symbol] = rate
+        data["intervals"][exchange][symbol] = interval
+        if volume is not None:
+            data["volumes"][symbol] = volume
+    tables = {}
+    for snapshot_id, data in market_data.items():
+        data["symbols"] = sorted(data["symbols"])
+        data["volumes"] = {s: data["volumes"].get(s, 0) for s in data["symbols"]}
+        tables[snapshot_id] = build_funding_table(data)
+    return tables
+
+
+def _load_arbitrage_tables(conn, snapshot_ids):
+    if not snapshot_ids:
+        return {}
+    placeholders = ','.join('?' * len(snapshot_ids))
+    rows = conn.execute(f'''
+        SELECT snapshot_id, symbol, long_exchange, long_rate, short_exchange, short_rate, apr
+        FROM arbitrage_opportunity WHERE snapshot_id IN ({placeholders})
+        ORDER BY snapshot_id, rank
+    ''', snapshot_ids).fetchall()
+    tables = {snapshot_id: [] for snapshot_id in snapshot_ids}
+    for snapshot_id, symbol, long_ex, long_rate, short_ex, short_rate, apr in rows:
+        tables[snapshot_id].append({
+            "symbol": symbol,
+            "long_exchange": f"{long_ex} ({(long_rate or 0):.6%})",
+            "short_exchange": f"{short_ex} ({(short_rate or 0):.6%})",
+            "apr": apr
+        })
+    return tables
+
+
+TABLE_LOADERS = {
+    'funding': _load_funding_tables,
+    'arbitrage': _load_arbitrage_tables,
+}
+
+
+@timed_db("get_snapshot_page")
+def get_snapshot_page(data_type, limit=10, before=None):
+    """
+    Returns one page of (id, ts) for the given data_type, newest first.
+    Keyset pagination: pass the last id of a page as `before` to get the next (older) one.
+    """
+    query = 'SELECT id, ts FROM snapshot WHERE data_type=?'
+    params = [data_type]
+    if before is not None:
+        query += ' AND id<?'
+        params.append(before)
+    query += ' ORDER BY id DESC LIMIT ?'
+    params.append(limit)
+    return get_reader().execute(query, params).fetchall()
+
+
+@timed_db("load_snapshots")
+def load_snapshots(data_type, page):
+    """
+    Loads the tables of a page of (id, ts) snapshots as [{"id", "created_at", "data"}].
+    """
+    loader = TABLE_LOADERS.get(data_type)
+    if loader is None:
+        return []
+    tables = loader(get_reader(), [snapshot_id for snapshot_id, _ in page])
+    return [
+        {"id": snapshot_id, "created_at": format_ts(ts), "data": tables.get(snapshot_id, [])}
+        for snapshot_id, ts in page
+    ]
+
+
+def get_history(data_type, limit=10, before=None):
+    """
+    Returns the most recent snapshots of the given data_type (older than `before`, if given) as
+    [{"id", "created_at", "data"}], newest first.
+    """
+    if data_type not in TABLE_LOADERS:
+        return []
+    return load_snapshots(data_type, get_snapshot_page(data_type, limit, before))
+
+
+@timed_db("get_history_version")
+def get_history_version(data_type):
+    """
+    Returns (newest id, snapshot count) for the given data_type. Any insert changes the first
+    and any pruning the second, so cached history responses are current while it is unchanged.
+    """
+    return get_reader().execute(
+        'SELECT COALESCE(MAX(id), 0), COUNT(*) FROM snapshot WHERE data_type=?', (data_type,)).fetchone()
+
+
+def get_latest_snapshot(data_type):
+    """
+    Retrieves the most recent snapshot of the given data_type (e.g., 'funding' or 'arbitrage').
+    Returns the data and the epoch timestamp it was created, or (None, None).
+    """
+    history = get_history(data_type, limit=1)
+    if not history:
+        return None, None
+    latest = history[0]
+    return latest["data"], calendar.timegm(time.strptime(latest["created_at"], "%Y-%m-%d %H:%M:%S"))
+
+
+@timed_db("get_symbol_history")
+def get_symbol_history(symbol, exchange=None, since=None, until=None, limit=1000):
+    """
+    Returns the stored funding rates of one symbol (optionally one exchange) between two
+    epoch timestamps, newest first. Served by an index range scan on (symbol, exchange, ts).
+    """
+    query = 'SELECT ts, exchange, funding_rate, funding_interval, volume FROM funding_rate WHERE symbol=?'
+    params = [symbol]
+    if exchange:
+        query += ' AND exchange=?'
+        params.append(exchange)
+    if since is not None:
+        query += ' AND ts>=?'
+        params.append(since)
+    if until is not None:
+        query += ' AND ts<=?'
+        params.append(until)
+    query += ' ORDER BY ts DESC LIMIT ?'
+    params.append(limit)
+    rows = get_reader().execute(query, params).fetchall()
+    return [
+        {
+            "created_at": format_ts(ts),
+            "exchange": ex,
+            "funding_rate": rate,
+            "funding_interval": interval,
+            "volume": volume,
+        }
+        for ts, ex, rate, interval, volume in rows
+    ]
+
+
+@timed_db("get_arbitrage_rollup")
+def get_arbitrage_rollup(bucket='hour', start=None, end=None):
+    """
+    Returns the pre-aggregated best arbitrage opportunity per bucket between two epoch
+    timestamps (default: the last ROLLUP_DEFAULT_BUCKETS buckets). Each entry holds the
+    bucket start, the top symbol and APR, and the min/mean/max of the per-snapshot best APR.
+    Cost depends only on the number of buckets returned, not on how much history is stored.
+    """
+    bucket_size = ROLLUP_BUCKETS[bucket]
+    if end is None:
+        end = int(time.time())
+    if start is None:
+        start = end - ROLLUP_DEFAULT_BUCKETS * bucket_size
+    rows = get_reader().execute('''
+        SELECT bucket, top_symbol, max_apr, min_apr, sum_apr, count FROM arbitrage_rollup
+        WHERE bucket_size=? AND bucket>=? AND bucket<=? ORDER BY bucket
+    ''', (bucket_size, start // bucket_size * bucket_size, end)).fetchall()
+    return [
+        {
+            "hour": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(bucket_start)),
+            "symbol": symbol,
+            "apr": max_apr,
+            "min_apr": min_apr,
+            "mean_apr": sum_apr / count,
+            "max_apr": max_apr,
+        }
+        for bucket_start, symbol, max_apr, min_apr, sum_apr, count in rows
+    ]
+
+
+@timed_db("save_funding_payments")
+def save_funding_payments(exchange, symbol, payments, first_ts, last_ts):
+    """
+    Stores a page of settled funding payments [(ts, rate)] for one exchange and symbol and
+    records the range [first_ts, last_ts] backfilled without gaps in the same transaction,
+    so an interrupted backfill resumes exactly around the stored pages.
+    """
+    with _lock:
+        conn = get_db()
+        with conn:
+            conn.executemany(
+                'INSERT OR IGNORE INTO funding_payment VALUES (?, ?, ?, ?)',
+                [(exchange, symbol, ts, rate) for ts, rate in payments]
+            )
+            conn.execute(
+                'INSERT OR REPLACE INTO backfill_checkpoint (exchange, symbol, first_ts, last_ts) VALUES (?, ?, ?, ?)',
+                (exchange, symbol, first_ts, last_ts)
+            )
+
+
+@timed_db("get_backfill_checkpoints")
+def get_backfill_checkpoints():
+    """
+    Returns {(exchange, symbol): (first, last backfilled epoch timestamp)}.
+    """
+    rows = get_reader().execute('SELECT exchange, symbol, first_ts, last_ts FROM backfill_checkpoint').fetchall()
+    return {(exchange, symbol): (first_ts, last_ts) for exchange, symbol, first_ts, last_ts in rows}
+
+
+@timed_db("get_funding_payments")
+def get_funding_payments(exchange, symbol, start, end):
+    """
+    Returns the settled funding payments [(ts, rate)] of one symbol on one exchange between two epoch timestamps.
+    """
+    return get_reader().execute('''
+        SELECT ts, funding_rate FROM funding_payment
+        WHERE exchange=? AND symbol=? AND ts>=? AND ts<=? ORDER BY ts
+    ''', (exchange, symbol, start, end)).fetchall()
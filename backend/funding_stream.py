@@ -0,0 +1,175 @@
+# Live Funding Rate Streaming
+import asyncio
+
+import ccxt.pro as ccxt_pro
+
+from data_collector import EXCHANGE_MODE, EXCHANGE_NAMES
+
+# How often buffered stream updates are applied and pushed to clients (seconds)
+FLUSH_INTERVAL = 0.5
+
+# Maximum number of unsent messages kept per client before it is resynced with a full snapshot
+CLIENT_QUEUE_SIZE = 100
+
+
+def create_pro_exchanges():
+    """
+    Creates one ccxt.pro (WebSocket) client per supported exchange.
+    """
+    if EXCHANGE_MODE == "mock":
+        from mock_exchange import create_mock_exchanges
+        return create_mock_exchanges(EXCHANGE_NAMES)
+    return {name: getattr(ccxt_pro, name)({"enableRateLimit": True}) for name in EXCHANGE_NAMES}
+
+
+def extract_stream_rate(entry):
+    """
+    Returns the funding rate carried by a streamed entry, or None if it has none.
+    Funding-rate streams (OKX) expose `fundingRate` directly; mark-price streams (Binance)
+    carry it in `info["r"]` and ticker streams (Bybit) in `info["fundingRate"]`.
+    """
+    rate = entry.get("fundingRate")
+    if rate is None:
+        info = entry.get("info") or {}
+        rate = info.get("r", info.get("fundingRate"))
+    try:
+        return float(rate) if rate not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+async def watch_rates(ex, symbols):
+    """
+    Waits for the next batch of streamed updates from one exchange using the best
+    channel it supports. Returns a dictionary of symbol -> funding rate.
+    """
+    if ex.has.get("watchFundingRates"):
+        entries = await ex.watch_funding_rates(symbols)
+    elif ex.has.get("watchMarkPrices"):
+        entries = await ex.watch_mark_prices(symbols)
+    else:
+        entries = await ex.watch_tickers(symbols)
+    rates = {}
+    for symbol, entry in entries.items():
+        rate = extract_stream_rate(entry)
+        if rate is not None:
+            rates[symbol] = rate
+    return rates
+
+
+class FundingStream:
+    """
+    Keeps a live funding-rate book per exchange and symbol from WebSocket streams and
+    pushes only the changed funding rows and the re-ranked arbitrage table to subscribers.
+    The symbol universe, volumes and stored history still come from the collector's
+    periodic REST pass; the stream only replaces the rates in between.
+    """
+
+    def __init__(self, collector, exchange_factory=create_pro_exchanges, flush_interval=FLUSH_INTERVAL):
+        self.collector = collector
+        self.exchange_factory = exchange_factory
+        self.flush_interval = flush_interval
+        self.exchanges = {}
+        self.subscribers = set()
+        self._pending = {}       # exchange -> {symbol: rate} received since the last flush
+        self._tasks = []
+
+    async def start(self):
+        """
+        Opens the WebSocket clients and starts one watcher per exchange plus the flush loop.
+        """
+        self.exchanges = self.exchange_factory()
+        self.collector.index.seed(self.exchanges)
+        self._tasks = [asyncio.create_task(self._watch(name, ex)) for name, ex in self.exchanges.items()]
+        self._tasks.append(asyncio.create_task(self._flush_loop()))
+
+    async def stop(self):
+        """
+        Stops all watchers and closes the WebSocket clients.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await asyncio.gather(*[ex.close() for ex in self.exchanges.values()], return_exceptions=True)
+
+    def subscribe(self):
+        """
+        Registers a new client and returns the queue its messages are delivered on.
+        """
+        queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    def snapshot_message(self):
+        """
+        Returns the full current state, sent to clients when they connect or fall behind.
+        """
+        return {
+            "type": "snapshot",
+            "funding": self.collector.snapshots.get("funding", (None,))[0],
+            "arbitrage": self.collector.snapshots.get("arbitrage", (None,))[0],
+        }
+
+    def _broadcast(self, message):
+        for queue in self.subscribers:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Slow client: drop its backlog and resync it with the full state
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(self.snapshot_message())
+
+    def push_update(self, previous):
+        """
+        Pushes the funding rows and arbitrage table that differ from the `previous` snapshots
+        (data_type -> (data, updated_at)). Used by workers that receive their tables from the
+        collector worker instead of running the streams themselves.
+        """
+        if not self.subscribers:
+            return
+        before = {row["symbol"]: row for row in previous.get("funding", (None,))[0] or []}
+        funding_rows = [row for row in self.collector.snapshots["funding"][0] if before.get(row["symbol"]) != row]
+        if funding_rows:
+            self._broadcast({"type": "funding", "rows": funding_rows})
+        arbitrage = self.collector.snapshots["arbitrage"][0]
+        if arbitrage != previous.get("arbitrage", (None,))[0]:
+            self._broadcast({"type": "arbitrage", "rows": arbitrage})
+
+    async def _watch(self, name, ex):
+        backoff = 1
+        while True:
+            # Wait for the collector to discover the symbol universe
+            if self.collector.market_data is None:
+                await asyncio.sleep(1)
+                continue
+            try:
+                rates = await watch_rates(ex, self.collector.market_data["symbols"])
+                self._pending.setdefault(name, {}).update(rates)
+                backoff = 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[stream] {name} watch failed: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if not self._pending:
+                continue
+            pending, self._pending = self._pending, {}
+            previous_arbitrage = self.collector.snapshots.get("arbitrage", (None,))[0]
+            changed = self.collector.apply_rates(pending)
+            if not changed or not self.subscribers:
+                continue
+            funding_rows = [row for row in self.collector.snapshots["funding"][0] if row["symbol"] in changed]
+            if funding_rows:
+                self._broadcast({"type": "funding", "rows": funding_rows})
+            arbitrage = self.collector.snapshots["arbitrage"][0]
+            if arbitrage != previous_arbitrage:
+                self._broadcast({"type": "arbitrage", "rows": arbitrage})
@@ -1,17 +1,80 @@
 # Imports and App Initialization
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-import ccxt
+from fastapi.responses import PlainTextResponse, StreamingResponse
 import asyncio
-import ccxt.async_support as ccxt_async
-import sqlite3
-import json
+import os
 import time
-from collections import defaultdict
-from datetime import datetime
+import db_manager
+import metrics
+import response_cache
+from arbitrage_engine import rank_arbitrage
+from backfill import Backfill, compute_carry
+from data_collector import EXCHANGE_NAMES, MAJOR_SYMBOLS, DataCollector
+from funding_stream import FundingStream
+from response_cache import ResponseCache
+from shared_snapshot import SHARED_DIR, WorkerCoordinator
+
+# Set FUNDING_STREAMING=0 to disable WebSocket ingestion and rely on the periodic REST refresh only
+STREAMING_ENABLED = os.environ.get("FUNDING_STREAMING", "1") != "0"
+
+# Background collector shared by all endpoints; every refresh is stored in the SQLite history
+collector = DataCollector(on_refresh=lambda market_data, tables: db_manager.save_refresh(market_data, tables['arbitrage']))
+# Live funding stream that keeps the collector's tables up to date between REST refreshes
+stream = FundingStream(collector)
+# Historical funding backfill, started on demand through /api/backfill
+backfill = Backfill(collector)
+
+async def start_collecting():
+    """
+    Starts fetching from the exchanges (in multi-worker mode, once this worker is elected).
+    """
+    await collector.start()
+    if STREAMING_ENABLED:
+        await stream.start()
+
+# With FUNDING_SHARED_DIR set (e.g., `uvicorn main:app --workers 4`), only one worker collects
+# and the others serve the snapshots it publishes
+coordinator = WorkerCoordinator(
+    collector, backfill, SHARED_DIR, on_elected=start_collecting, on_update=stream.push_update,
+) if SHARED_DIR else None
+
+# Encoded (JSON + gzip) responses, serialized once per snapshot version
+snapshot_responses = ResponseCache()
+history_responses = ResponseCache()
+
+# History pages up to this many snapshots are cached as bytes; larger ones are streamed
+HISTORY_CACHE_LIMIT = 100
+# Snapshots loaded from the database per chunk of a streamed history response
+HISTORY_BATCH_SIZE = 50
+
+@asynccontextmanager
+async def lifespan(app):
+    """
+    Starts the background collector on startup and closes its exchange clients on shutdown.
+    The most recent stored snapshots are loaded first so requests can be served immediately.
+    In multi-worker mode only the elected collector worker starts collecting.
+    """
+    db_manager.init_db(maintenance=coordinator is None or coordinator.elect())
+    for data_type in ('funding', 'arbitrage'):
+        data, created_at = db_manager.get_latest_snapshot(data_type)
+        collector.seed(data_type, data, created_at)
+    if coordinator:
+        await coordinator.start()
+    else:
+        await start_collecting()
+    yield
+    await backfill.stop()
+    if coordinator:
+        await coordinator.stop()
+    if STREAMING_ENABLED:
+        await stream.stop()
+    await collector.stop()
+    db_manager.close_db()
 
 # FastAPI App and CORS Setup
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Allow all origins during development; restrict to your domain in production
@@ -22,292 +85,254 @@ app.add_middleware(
 
 # Get Perpetual Symbols for Each Exchange
 @app.get("/api/perp-symbols")
-def get_perp_symbols():
+async def get_perp_symbols(request: Request):
     """
     Returns a dictionary of all perpetual swap symbols for each supported exchange.
     This helps the frontend know which symbols are available for funding rate comparison.
+    Served from the collector's market index (cached on disk, reloaded in the background).
     """
-    exchanges = {
-        "binance": ccxt.binance(),
-        "bybit": ccxt.bybit(),
-        "okx": ccxt.okx(),
-    }
-    result = {}
-    for name, ex in exchanges.items():
-        markets = ex.load_markets()
-        # Only include symbols that are perpetual swaps ("swap": True)
-        perp_symbols = [s for s, m in markets.items() if m.get("swap", False)]
-        result[name] = perp_symbols
-    return result
+    index = await collector.get_index()
+    encoded = snapshot_responses.get(
+        ('perp-symbols', index.version),
+        lambda: {name: sorted(index.swaps.get(name, ())) for name in EXCHANGE_NAMES},
+    )
+    return response_cache.send(request, encoded)
 
 # Get Funding Rates for Major Symbols
 @app.get("/api/funding-rates")
-def get_funding_rates():
+async def get_funding_rates(request: Request):
     """
     Returns the current funding rates for a small set of major symbols (BTC, ETH) across all exchanges.
     This is a simple example endpoint for quick funding rate checks.
+    Each entry is the ccxt funding rate structure from the collector's latest pass (its rate kept
+    live by the stream, its interval filled in where the bulk endpoint omits it), or an error if
+    the exchange has no rate for the symbol.
     """
-    exchanges = {
-        "binance": ccxt.binance(),
-        "bybit": ccxt.bybit(),
-        "okx": ccxt.okx(),
-    }
-    symbols = ["BTC/USDT:USDT", "ETH/USDT:USDT"]
+    await collector.get('funding')
+    if collector.market_data is None:
+        # Snapshots seeded from the database at startup carry no collection pass yet
+        await collector.refresh()
+    encoded = snapshot_responses.get(('funding-rates', collector.versions['funding']), build_major_rates)
+    return response_cache.send(request, encoded)
+
+def build_major_rates():
+    market_data = collector.market_data
     result = {}
-    for name, ex in exchanges.items():
+    for name in market_data["exchanges"]:
         rates = {}
-        for symbol in symbols:
-            try:
-                rate = ex.fetch_funding_rate(symbol)
-                rates[symbol] = rate
-            except Exception as e:
-                rates[symbol] = {"error": str(e)}
+        for symbol in MAJOR_SYMBOLS:
+            rate = market_data["major_rates"][name].get(symbol)
+            if rate is None:
+                rates[symbol] = {"error": f"no funding rate for {symbol} on {name}"}
+                continue
+            hours = market_data["intervals"][name].get(symbol)
+            rates[symbol] = rate if rate.get("interval") or not hours else {**rate, "interval": f"{hours:g}h"}
         result[name] = rates
     return result
 
-# Database Helper Functions
-def get_db():
+async def send_snapshot(request, data_type):
     """
-    Opens a connection to the SQLite database for storing and retrieving funding/arbitrage snapshots.
+    Sends the collector's current snapshot as bytes encoded once per snapshot version,
+    answering 304 Not Modified when the client already has that version.
     """
-    return sqlite3.connect('funding_history.db')
+    data = await collector.get(data_type)
+    encoded = snapshot_responses.get((data_type, collector.versions[data_type]), lambda: data)
+    return response_cache.send(request, encoded)
 
-def save_snapshot(data_type, data):
+# Get Common Funding Table (Top 50 by Volume)
+@app.get("/api/common-funding-table")
+async def common_funding_table(request: Request):
     """
-    Saves a snapshot of funding or arbitrage data to the database with a timestamp.
-    If the table does not exist, it is created automatically.
+    Returns a table comparing funding rates for the top 50 USDT-margined perpetual symbols
+    (by Binance 24h quote volume) that are listed on all supported exchanges.
+    Served from the background collector's in-memory snapshot (refreshed every 5 minutes).
     """
-    conn = get_db()
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS funding_snapshot (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            data_type TEXT,
-            data TEXT
-        )
-    ''')
-    c.execute(
-        'INSERT INTO funding_snapshot (data_type, data) VALUES (?, ?)',
-        (data_type, json.dumps(data))
-    )
-    conn.commit()
-    conn.close()
+    return await send_snapshot(request, 'funding')
 
-def get_latest_snapshot(data_type):
+# Get Top Arbitrage Opportunities (Top 10 by APR)
+@app.get("/api/top-arbitrage")
+async def top_arbitrage(request: Request, k: int = Query(10, ge=1, le=500), exchanges: str = None):
     """
-    Retrieves the most recent snapshot of the given data_type (e.g., 'funding' or 'arbitrage').
-    Returns the data and the timestamp it was created.
+    Returns the top k (default 10) arbitrage opportunities (by annualized APR) for USDT-margined
+    perpetuals that are listed on all supported exchanges. APRs account for each symbol's funding
+    interval on each exchange. `exchanges` optionally restricts the pairs to a comma-separated list
+    (e.g., "binance,okx"). The default view is served from the background collector's snapshot.
     """
-    conn = get_db()
-    c = conn.cursor()
-    c.execute('''
-        SELECT data, created_at FROM funding_snapshot
-        WHERE data_type=?
-        ORDER BY created_at DESC LIMIT 1
-    ''', (data_type,))
-    row = c.fetchone()
-    conn.close()
-    if row:
-        data, created_at = row
-        return json.loads(data), created_at
-    return None, None
+    if k == 10 and not exchanges:
+        return await send_snapshot(request, 'arbitrage')
+    names = exchanges.split(',') if exchanges else None
+    if names is not None:
+        names = [name.strip() for name in names]
+        unknown = [name for name in names if name not in EXCHANGE_NAMES]
+        if unknown or len(set(names)) != len(names) or len(names) < 2:
+            raise HTTPException(status_code=400, detail=f"exchanges must list at least two distinct names from {EXCHANGE_NAMES}")
+    if collector.market_data is None:
+        await collector.refresh()
+    return rank_arbitrage(collector.market_data, k=k, exchanges=names)
 
-# Get Common Funding Table (Top 50 by Volume)
-@app.get("/api/common-funding-table")
-async def common_funding_table():
+# Push Live Funding and Arbitrage Updates
+@app.websocket("/ws/funding")
+async def funding_updates(websocket: WebSocket):
     """
-    Returns a table comparing funding rates for the top 50 USDT-margined perpetual symbols
-    (by Binance 24h quote volume) that are listed on all supported exchanges.
-    Uses caching (5 minutes) to reduce API load and improve performance.
+    Pushes live updates to the frontend over a WebSocket.
+    Sends the full funding and arbitrage tables on connect, then only the funding rows that
+    changed ({"type": "funding", "rows": [...]}) and the re-ranked arbitrage table
+    ({"type": "arbitrage", "rows": [...]}) whenever it changes.
     """
-    cached, cached_time = get_latest_snapshot('funding')
-    # Use cached data if it is less than 5 minutes old
-    if cached and (time.time() - time.mktime(time.strptime(cached_time, "%Y-%m-%d %H:%M:%S"))) < 300:
-        return cached
+    await websocket.accept()
+    queue = stream.subscribe()
 
-    # Initialize async exchange clients
-    exchanges = {
-        "binance": ccxt_async.binance(),
-        "bybit": ccxt_async.bybit(),
-        "okx": ccxt_async.okx(),
-    }
-    # Step 1: Get all perpetual symbols for each exchange
-    symbol_sets = {}
-    for name, ex in exchanges.items():
-        markets = await ex.load_markets()
-        perp_symbols = set([s for s, m in markets.items() if m.get("swap", False)])
-        symbol_sets[name] = perp_symbols
-    # Step 2: Find symbols that are listed on all exchanges (intersection)
-    common_symbols = list(sorted(set.intersection(*symbol_sets.values())))
-    # Step 3: Keep only USDT-margined perpetual contracts
-    usdt_perp_symbols = [s for s in common_symbols if s.endswith(":USDT")]
-    # Step 4: Remove duplicates by base symbol (e.g., only one BTC/USDT:USDT per base)
-    def extract_base_symbol(symbol):
-        return symbol.split('/')[0]
-    unique_base = {}
-    for symbol in usdt_perp_symbols:
-        base = extract_base_symbol(symbol)
-        if base not in unique_base:
-            unique_base[base] = symbol
-    filtered_symbols = list(unique_base.values())
-    # Step 5: Get Binance 24h quote volume for each symbol and select top 50
-    async def get_volume(symbol):
-        try:
-            ticker = await exchanges["binance"].fetch_ticker(symbol)
-            return float(ticker.get("quoteVolume", 0)), ticker.get("quoteVolume", 0)
-        except Exception:
-            return 0, 0
-    volume_results = await asyncio.gather(*[get_volume(symbol) for symbol in filtered_symbols])
-    vol_list = list(zip(filtered_symbols, volume_results))
-    vol_list.sort(key=lambda x: x[1][0], reverse=True)
-    top_symbols = [symbol for symbol, _ in vol_list[:50]]
-    top_volumes = {symbol: v[1] for symbol, v in vol_list[:50]}
-    # Step 6: Fetch funding rates for each symbol on each exchange (async)
-    async def fetch_rate(ex, symbol):
-        try:
-            rate = await ex.fetch_funding_rate(symbol)
-            return rate.get("fundingRate")
-        except Exception:
-            return None
-    table = []
-    for symbol in top_symbols:
-        row = {"symbol": symbol, "Volume (Binance)": top_volumes[symbol]}
-        tasks = [fetch_rate(ex, symbol) for ex in exchanges.values()]
-        results = await asyncio.gather(*tasks)
-        for i, name in enumerate(exchanges.keys()):
-            row[name] = results[i]
-        table.append(row)
-    # Always close all async exchange clients to avoid resource warnings
-    await asyncio.gather(*[ex.close() for ex in exchanges.values()])
-    # Save the result to the database for caching and history
-    save_snapshot('funding', table)
-    return table
+    async def send_updates():
+        await collector.get('funding')
+        await websocket.send_json(stream.snapshot_message())
+        while True:
+            await websocket.send_json(await queue.get())
 
-# Get Top Arbitrage Opportunities (Top 10 by APR)
-@app.get("/api/top-arbitrage")
-async def top_arbitrage():
+    async def wait_for_disconnect():
+        # Clients never send anything; reading notices a closed socket without waiting for the next update
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    tasks = [asyncio.create_task(send_updates()), asyncio.create_task(wait_for_disconnect())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    except (WebSocketDisconnect, OSError):
+        # The client went away mid-send (uvicorn raises ClientDisconnected, an OSError)
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+        stream.unsubscribe(queue)
+
+# Get Funding Rate History for One Symbol
+@app.get("/api/symbol-history")
+def get_symbol_history(symbol: str, exchange: str = None, since: int = None, until: int = None, limit: int = 1000):
     """
-    Returns the top 10 arbitrage opportunities (by annualized APR) for USDT-margined perpetuals
-    that are listed on all supported exchanges. Uses 5-minute caching for efficiency.
+    Returns the stored funding rates of one symbol (e.g., "BTC/USDT:USDT"), newest first.
+    Optionally filtered by exchange and by a since/until range of epoch seconds.
     """
-    cached, cached_time = get_latest_snapshot('arbitrage')
-    # Use cached data if it is less than 5 minutes old
-    if cached and (time.time() - time.mktime(time.strptime(cached_time, "%Y-%m-%d %H:%M:%S"))) < 300:
-        return cached
-    # Initialize async exchange clients
-    exchanges = {
-        "binance": ccxt_async.binance(),
-        "bybit": ccxt_async.bybit(),
-        "okx": ccxt_async.okx(),
-    }
-    # Step 1: Get all perpetual symbols for each exchange
-    symbol_sets = {}
-    for name, ex in exchanges.items():
-        markets = await ex.load_markets()
-        perp_symbols = set([s for s, m in markets.items() if m.get("swap", False)])
-        symbol_sets[name] = perp_symbols
-    # Step 2: Find symbols that are listed on all exchanges (intersection)
-    common_symbols = list(sorted(set.intersection(*symbol_sets.values())))
-    # Step 3: Keep only USDT-margined perpetual contracts
-    usdt_perp_symbols = [s for s in common_symbols if s.endswith(":USDT")]
-    # Step 4: Remove duplicates by base symbol
-    def extract_base_symbol(symbol):
-        return symbol.split('/')[0]
-    unique_base = {}
-    for symbol in usdt_perp_symbols:
-        base = extract_base_symbol(symbol)
-        if base not in unique_base:
-            unique_base[base] = symbol
-    filtered_symbols = list(unique_base.values())
-    # Step 5: Fetch funding rates for each symbol on each exchange (async)
-    async def fetch_rate(ex, symbol):
-        try:
-            rate = await ex.fetch_funding_rate(symbol)
-            return rate.get("fundingRate")
-        except Exception:
-            return None
-    table = []
-    for symbol in filtered_symbols:
-        rates = {}
-        tasks = [fetch_rate(ex, symbol) for ex in exchanges.values()]
-        results = await asyncio.gather(*tasks)
-        for i, name in enumerate(exchanges.keys()):
-            rates[name] = results[i]
-        # Only consider symbols with at least 2 valid funding rates
-        valid_rates = {k: v for k, v in rates.items() if v is not None}
-        if len(valid_rates) < 2:
-            continue
-        # Find the exchange with the lowest (long) and highest (short) funding rates
-        long_ex, long_rate = min(valid_rates.items(), key=lambda x: x[1])
-        short_ex, short_rate = max(valid_rates.items(), key=lambda x: x[1])
-        diff = short_rate - long_rate
-        # Funding rate is per 8 hours, so annualize: diff * 3 (per day) * 365 (per year) * 100 (percent)
-        apr = diff * 3 * 365 * 100
-        table.append({
-            "symbol": symbol,
-            "long_exchange": f"{long_ex} ({long_rate:.6%})",
-            "short_exchange": f"{short_ex} ({short_rate:.6%})",
-            "apr": apr
-        })
-    # Sort by APR in descending order and keep the top 10
-    table.sort(key=lambda x: x["apr"], reverse=True)
-    table = table[:10]
-    # Save the result to the database for caching and history
-    save_snapshot('arbitrage', table)
-    return table
+    return db_manager.get_symbol_history(symbol, exchange, since, until, limit)
+
+# Start or Inspect the Historical Funding Backfill
+@app.post("/api/backfill")
+async def start_backfill(days: float = Query(365, gt=0)):
+    """
+    Starts backfilling settled funding rates for the last `days` days on every exchange
+    (resuming from stored checkpoints). Returns the job status; only one job runs at a time.
+    In multi-worker mode the request is handed to the collector worker, which runs the job.
+    """
+    if collector.following:
+        return coordinator.request_backfill(days)
+    return backfill.start(days)
+
+@app.get("/api/backfill")
+def get_backfill_status():
+    """
+    Returns the progress of the current or last backfill job.
+    """
+    return backfill.status
+
+# Backtest Realized Funding Carry
+@app.get("/api/backtest/carry")
+def backtest_carry(
+    symbol: str,
+    long: str,
+    short: str,
+    start: int = Query(None, alias='from'),
+    end: int = Query(None, alias='to'),
+):
+    """
+    Returns the realized funding carry (in %) of going long `symbol` on the `long` exchange and
+    short on the `short` exchange between `from` and `to` (epoch seconds, default: last 30 days),
+    with its annualized APR and a daily cumulative series. Requires backfilled history.
+    """
+    if long not in EXCHANGE_NAMES or short not in EXCHANGE_NAMES:
+        raise HTTPException(status_code=400, detail=f"exchanges must be among {EXCHANGE_NAMES}")
+    if end is None:
+        end = int(time.time())
+    if start is None:
+        start = end - 30 * 86400
+    return compute_carry(symbol, long, short, start, end)
 
 # Get Historical Snapshots (Optional)
 @app.get("/api/history/{data_type}")
-def get_history(data_type: str, limit: int = 10):
+def get_history(
+    request: Request,
+    data_type: str,
+    limit: int = Query(10, ge=1),
+    before: int = None,
+    format: str = 'json',
+):
     """
-    Returns a list of historical snapshots for the given data_type (e.g., 'funding' or 'arbitrage').
-    Each snapshot includes an id, timestamp, and the data at that time.
-    The limit parameter controls how many recent snapshots are returned (default: 10).
+    Returns a list of historical snapshots for the given data_type (e.g., 'funding' or 'arbitrage'),
+    newest first. Each snapshot includes an id, timestamp, and the data at that time.
+    The limit parameter controls how many snapshots are returned (default: 10); pass the id from
+    the X-Next-Cursor header as `before` to get the next (older) page. `format=ndjson` (or
+    `Accept: application/x-ndjson`) returns one snapshot per line.
+    Large pages are streamed from the database in batches instead of being built in memory.
     """
-    conn = get_db()
-    c = conn.cursor()
-    c.execute('''
-        SELECT id, created_at, data FROM funding_snapshot
-        WHERE data_type=?
-        ORDER BY created_at DESC LIMIT ?
-    ''', (data_type, limit))
-    rows = c.fetchall()
-    conn.close()
-    return [
-        {
-            "id": row[0],
-            "created_at": row[1],
-            "data": json.loads(row[2])
-        }
-        for row in rows
-    ]
+    if format not in ('json', 'ndjson'):
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'ndjson'")
+    ndjson = format == 'ndjson' or 'application/x-ndjson' in request.headers.get('accept', '')
+    if data_type not in db_manager.TABLE_LOADERS:
+        return []
+    key = (data_type, db_manager.get_history_version(data_type), limit, before, ndjson)
+    etag = response_cache.key_etag(key)
+    if response_cache.is_not_modified(request, etag):
+        return response_cache.not_modified(etag)
+    page = db_manager.get_snapshot_page(data_type, limit, before)
+    headers = {"X-Next-Cursor": str(page[-1][0])} if len(page) == limit else {}
+    if limit <= HISTORY_CACHE_LIMIT and not ndjson:
+        encoded = history_responses.get(key, lambda: db_manager.load_snapshots(data_type, page), etag)
+        return response_cache.send(request, encoded, headers)
+    batches = (
+        db_manager.load_snapshots(data_type, page[i:i + HISTORY_BATCH_SIZE])
+        for i in range(0, len(page), HISTORY_BATCH_SIZE)
+    )
+    headers.update({"ETag": etag, "Cache-Control": "no-cache"})
+    media_type = 'application/x-ndjson' if ndjson else 'application/json'
+    return StreamingResponse(response_cache.iter_json(batches, ndjson), media_type=media_type, headers=headers)
 
 @app.get("/api/history/arbitrage/hourly")
-def get_hourly_top_arbitrage():
-    conn = sqlite3.connect("funding_history.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT created_at, data FROM funding_snapshot WHERE data_type='arbitrage' ORDER BY created_at ASC")
-    rows = cursor.fetchall()
-    conn.close()
-
-    hourly = defaultdict(list)
-    for created_at, data_json in rows:
-        dt = datetime.fromisoformat(created_at)
-        hour_key = dt.replace(minute=0, second=0, microsecond=0)
-        data = json.loads(data_json)
-        hourly[hour_key].append(data)
+def get_hourly_top_arbitrage(
+    request: Request,
+    bucket: str = 'hour',
+    start: int = Query(None, alias='from'),
+    end: int = Query(None, alias='to'),
+):
+    """
+    Returns, for each bucket ('hour' by default, or 'day'), the coin with the highest arbitrage APR
+    and its value, plus the min/mean/max of the best APR across the bucket's snapshots.
+    `from`/`to` are epoch seconds; without them the most recent 48 buckets are returned.
+    """
+    if bucket not in db_manager.ROLLUP_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of {list(db_manager.ROLLUP_BUCKETS)}")
+    # Rollups only change when arbitrage snapshots are stored; the default window also moves with each new bucket
+    key = ('rollup', db_manager.get_history_version('arbitrage'), bucket, start, end)
+    if end is None:
+        key += (int(time.time()) // db_manager.ROLLUP_BUCKETS[bucket],)
+    encoded = history_responses.get(key, lambda: db_manager.get_arbitrage_rollup(bucket, start, end))
+    return response_cache.send(request, encoded)
 
-    result = []
-    for hour, data_list in hourly.items():
-        all_coins = [coin for snapshot in data_list for coin in snapshot]
-        if not all_coins:
-            continue
-        top = max(all_coins, key=lambda x: x.get("apr", float('-inf')))
-        result.append({
-            "hour": hour.isoformat(),
-            "symbol": top["symbol"],
-            "apr": top["apr"]
-        })
-    result.sort(key=lambda x: x["hour"])
-    return result 
\ No newline at end of file
+# Prometheus Metrics
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Exposes Prometheus metrics: per-exchange/per-method call latency and errors, collection
+    pipeline stage timings, snapshot cache hits/misses and age, and SQLite operation timings.
+    In multi-worker mode every worker reports the metrics published by the collector worker.
+    """
+    ages = [({"data_type": data_type}, collector.age(data_type)) for data_type in collector.builders]
+    gauges = [
+        ("funding_snapshot_age_seconds", "Seconds since each snapshot was last refreshed.",
+         [(labels, age) for labels, age in ages if age is not None]),
+        ("funding_market_index_age_seconds", "Seconds since the market metadata was loaded from the exchanges.",
+         [({}, collector.index.age())] if collector.index.updated_at is not None else []),
+        ("funding_collector_worker", "1 if this worker collects from the exchanges, 0 if it follows.",
+         [({}, 0 if collector.following else 1)]),
+        ("funding_stream_subscribers", "Connected WebSocket clients.", [({}, len(stream.subscribers))]),
+    ]
+    state = coordinator.collector_metrics() if collector.following else None
+    return PlainTextResponse(metrics.render(gauges, state), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,209 @@
+# Market Metadata Cache and Symbol Universe Index
+import asyncio
+import json
+import os
+import time
+
+from metrics import timed_call
+
+# File the market metadata is persisted to, so restarts don't wait on load_markets()
+MARKETS_CACHE_PATH = os.environ.get("FUNDING_MARKETS_CACHE", "market_cache.json")
+
+# How long cached market metadata is used before it is reloaded in the background (seconds)
+MARKETS_TTL = int(os.environ.get("FUNDING_MARKETS_TTL", "3600"))
+
+
+def extract_base_symbol(symbol):
+    """
+    Returns the base asset of a ccxt symbol (e.g., "BTC/USDT:USDT" -> "BTC").
+    """
+    return symbol.split('/')[0]
+
+
+def common_usdt_perps(swaps):
+    """
+    Returns the USDT-margined perpetual symbols listed on every exchange (swaps: exchange -> set of
+    swap symbols), with one symbol per base asset.
+    """
+    if not swaps:
+        return []
+    # Step 1: Find symbols that are listed on all exchanges (intersection)
+    common_symbols = sorted(set.intersection(*swaps.values()))
+    # Step 2: Keep only USDT-margined perpetual contracts
+    usdt_perp_symbols = [s for s in common_symbols if s.endswith(":USDT")]
+    # Step 3: Remove duplicates by base symbol (e.g., only one BTC/USDT:USDT per base)
+    unique_base = {}
+    for symbol in usdt_perp_symbols:
+        base = extract_base_symbol(symbol)
+        if base not in unique_base:
+            unique_base[base] = symbol
+    return list(unique_base.values())
+
+
+class MarketIndex:
+    """
+    Perpetual swap markets of every exchange plus the indexes derived from them: per-exchange
+    swap sets and base -> symbols maps, the common USDT perpetual universe and known funding
+    intervals. Persisted to disk and warm-loaded at startup; reloaded from the exchanges in
+    the background once older than the TTL. Derived indexes are only rebuilt for the
+    exchanges whose listings actually changed.
+    """
+
+    def __init__(self, path=MARKETS_CACHE_PATH, ttl=MARKETS_TTL, tag=None):
+        self.path = path
+        self.ttl = ttl
+        self.tag = tag              # stored with the cache; a file written under another tag (e.g., mock) is ignored
+        self.markets = {}           # exchange -> {symbol: ccxt market} (perpetual swaps only)
+        self.swaps = {}             # exchange -> set of swap symbols
+        self.bases = {}             # exchange -> {base asset: [swap symbols]}
+        self.common = []            # USDT perpetuals listed on every exchange, one per base asset
+        self.common_by_base = {}    # base asset -> common symbol
+        self.intervals = {}         # exchange -> {symbol: funding interval in hours}
+        self.updated_at = None      # when the markets were last loaded from the exchanges (epoch seconds)
+        self.version = 0            # bumped whenever listings change
+        self.dirty = False          # intervals learned since the cache file was written
+        self._inflight = None
+
+    def load(self):
+        """
+        Warm-loads the index from the cache file. Returns True if a usable cache was found.
+        """
+        try:
+            with open(self.path) as f:
+                cached = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            print(f"[markets] ignoring unreadable cache {self.path}: {e}")
+            return False
+        if cached.get("tag") != self.tag:
+            return False
+        for name, markets in cached["markets"].items():
+            self.update(name, markets)
+        self.intervals = cached.get("intervals", {})
+        self.updated_at = cached.get("updated_at")
+        return True
+
+    def save(self):
+        """
+        Writes the markets and intervals to the cache file (atomically, via a temporary file).
+        """
+        self.dirty = False
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "tag": self.tag,
+                "updated_at": self.updated_at,
+                "markets": self.markets,
+                "intervals": self.intervals,
+            }, f)
+        os.replace(tmp_path, self.path)
+
+    def is_fresh(self):
+        return self.updated_at is not None and time.time() - self.updated_at < self.ttl
+
+    def age(self):
+        return None if self.updated_at is None else time.time() - self.updated_at
+
+    def update(self, name, markets):
+        """
+        Stores the markets of one exchange and updates the derived indexes for the listings
+        that were added or removed. Returns True if the exchange's listings changed.
+        """
+        self.markets[name] = {s: m for s, m in markets.items() if m.get("swap", False)}
+        return self._set_swaps(name, set(self.markets[name]))
+
+    def _set_swaps(self, name, swaps):
+        previous = self.swaps.get(name, set())
+        if swaps == previous and name in self.swaps:
+            return False
+        bases = self.bases.setdefault(name, {})
+        for symbol in previous - swaps:
+            base = extract_base_symbol(symbol)
+            bases[base].remove(symbol)
+            if not bases[base]:
+                del bases[base]
+        for symbol in sorted(swaps - previous):
+            bases.setdefault(extract_base_symbol(symbol), []).append(symbol)
+        self.swaps[name] = swaps
+        self.common = common_usdt_perps(self.swaps)
+        self.common_by_base = {extract_base_symbol(s): s for s in self.common}
+        self.version += 1
+        return True
+
+    def summary(self):
+        """
+        Returns the listings (swap symbols per exchange), as published to the other workers.
+        """
+        return {"updated_at": self.updated_at, "swaps": {name: sorted(swaps) for name, swaps in self.swaps.items()}}
+
+    def install(self, summary):
+        """
+        Installs listings published by the collector worker (see summary()). Workers that
+        install listings never hold market structures or talk to the exchanges.
+        """
+        for name, swaps in summary["swaps"].items():
+            self._set_swaps(name, set(swaps))
+        self.updated_at = summary["updated_at"]
+
+    def update_intervals(self, name, intervals):
+        """
+        Records the funding intervals (symbol -> hours) seen for one exchange, ignoring unknown ones.
+        """
+        known = self.intervals.setdefault(name, {})
+        for symbol, hours in intervals.items():
+            if hours is not None and known.get(symbol) != hours:
+                known[symbol] = hours
+                self.dirty = True
+
+    def seed(self, exchanges):
+        """
+        Installs the cached markets on ccxt clients that have not loaded any yet, so their
+        first call does not trigger a full load_markets().
+        """
+        for name, ex in exchanges.items():
+            if self.markets.get(name) and not ex.markets and hasattr(ex, "set_markets"):
+                ex.set_markets(self.markets[name])
+
+    def refresh(self, exchanges):
+        """
+        Reloads the markets from the exchanges, or joins the reload already in flight.
+        Returns an awaitable; failures are logged and leave the previous metadata in place.
+        """
+        if self._inflight is None:
+            self._inflight = asyncio.create_task(self._refresh(exchanges))
+            self._inflight.add_done_callback(self._clear_inflight)
+        return asyncio.shield(self._inflight)
+
+    async def cancel(self):
+        """
+        Cancels a reload still in flight (e.g., on shutdown, before the clients are closed).
+        """
+        if self._inflight:
+            self._inflight.cancel()
+            await asyncio.gather(self._inflight, return_exceptions=True)
+
+    def _clear_inflight(self, task):
+        if self._inflight is task:
+            self._inflight = None
+
+    async def _refresh(self, exchanges):
+        names = list(exchanges.keys())
+        results = await asyncio.gather(
+            *[timed_call(exchanges[name], 'load_markets', True) for name in names], return_exceptions=True
+        )
+        for name, markets in zip(names, results):
+            if isinstance(markets, Exception):
+                print(f"[markets] {name} load_markets failed: {markets}")
+                continue
+            if self.update(name, markets):
+                print(f"[markets] {name}: {len(self.swaps[name])} perpetual swaps, {len(self.common)} common")
+        if any(isinstance(markets, Exception) for markets in results):
+            return
+        # Intervals expire with the markets: the next collection pass learns them again
+        self.intervals = {}
+        self.updated_at = time.time()
+        try:
+            await asyncio.to_thread(self.save)
+        except OSError as e:
+            print(f"[markets] failed to write cache {self.path}: {e}")
@@ -0,0 +1,156 @@
+# Prometheus Metrics
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency histogram buckets (seconds), from sub-millisecond DB reads to slow exchange calls
+BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+
+class Counter:
+    """
+    Monotonic counter keyed by label values.
+    """
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.label_names)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self, values=None):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for key, value in sorted((self.values if values is None else values).items()):
+            lines.append(f'{self.name}{_format_labels(zip(self.label_names, key))} {value}')
+        return lines
+
+
+class Histogram:
+    """
+    Cumulative latency histogram keyed by label values.
+    """
+
+    def __init__(self, name, help_text, label_names, buckets=BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self.values = {}         # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.label_names)
+        with self._lock:
+            data = self.values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self, values=None):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for key, data in sorted((self.values if values is None else values).items()):
+            labels = list(zip(self.label_names, key))
+            for bound, count in zip(self.buckets, data):
+                lines.append(f'{self.name}_bucket{_format_labels(labels + [("le", bound)])} {count}')
+            lines.append(f'{self.name}_bucket{_format_labels(labels + [("le", "+Inf")])} {data[-1]}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {data[-2]}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {data[-1]}')
+        return lines
+
+
+exchange_call_seconds = Histogram(
+    'funding_exchange_call_seconds', 'Latency of exchange API calls.', ('exchange', 'method'))
+exchange_call_errors = Counter(
+    'funding_exchange_call_errors_total', 'Exchange API calls that raised an error.', ('exchange', 'method'))
+pipeline_stage_seconds = Histogram(
+    'funding_pipeline_stage_seconds', 'Time spent in each step of a collection pass.', ('stage',))
+snapshot_requests = Counter(
+    'funding_snapshot_requests_total', 'Snapshot reads served from memory (hit) or waiting on a refresh (miss).',
+    ('data_type', 'result'))
+db_operation_seconds = Histogram(
+    'funding_db_operation_seconds', 'Latency of SQLite reads and writes.', ('operation',))
+
+REGISTRY = [exchange_call_seconds, exchange_call_errors, pipeline_stage_seconds, snapshot_requests, db_operation_seconds]
+
+
+async def timed_call(ex, method, *args, **kwargs):
+    """
+    Calls an exchange client method, recording its latency and counting errors before re-raising them.
+    """
+    start = time.perf_counter()
+    try:
+        return await getattr(ex, method)(*args, **kwargs)
+    except Exception:
+        exchange_call_errors.inc(exchange=ex.id, method=method)
+        raise
+    finally:
+        exchange_call_seconds.observe(time.perf_counter() - start, exchange=ex.id, method=method)
+
+
+def timed_db(operation):
+    """
+    Decorator recording the latency of a database function under the given operation name.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with db_operation_seconds.time(operation=operation):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def export_state():
+    """
+    Returns the values of every registered metric in a JSON-serializable form, so another
+    process can render them (see render()).
+    """
+    state = {}
+    for metric in REGISTRY:
+        with metric._lock:
+            # Histogram values are lists updated in place, so copy them while observations are held off
+            state[metric.name] = [[list(key), list(value) if isinstance(value, list) else value]
+                                  for key, value in metric.values.items()]
+    return state
+
+
+def render(gauges=(), state=None):
+    """
+    Renders every metric in the Prometheus text exposition format.
+    `gauges` is a list of (name, help, [(labels dict, value)]) computed at scrape time.
+    `state` (from export_state(), e.g., published by another worker) replaces this process's values.
+    """
+    lines = []
+    for metric in REGISTRY:
+        values = None
+        if state is not None:
+            values = {tuple(key): value for key, value in state.get(metric.name, [])}
+        lines.extend(metric.render(values))
+    for name, help_text, samples in gauges:
+        lines.extend([f'# HELP {name} {help_text}', f'# TYPE {name} gauge'])
+        for labels, value in samples:
+            lines.append(f'{name}{_format_labels(sorted(labels.items()))} {value}')
+    return '\n'.join(lines) + '\n'
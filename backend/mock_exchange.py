@@ -0,0 +1,139 @@
+# Mock Exchange Layer
+import asyncio
+import os
+import random
+import time
+from collections import Counter
+
+import ccxt
+
+# Settings used when the collector runs with FUNDING_EXCHANGE_MODE=mock
+MOCK_UNIVERSE_SIZE = int(os.environ.get("MOCK_UNIVERSE_SIZE", "200"))
+MOCK_LATENCY_MS = float(os.environ.get("MOCK_LATENCY_MS", "50"))
+MOCK_JITTER_MS = float(os.environ.get("MOCK_JITTER_MS", "20"))
+MOCK_ERROR_RATE = float(os.environ.get("MOCK_ERROR_RATE", "0"))
+# Set MOCK_BULK_INTERVALS=0 to leave the interval out of bulk funding rates, as Binance's and Bybit's do
+MOCK_BULK_INTERVALS = os.environ.get("MOCK_BULK_INTERVALS", "1") != "0"
+
+# Exchanges whose bulk funding endpoint does not report intervals (with MOCK_BULK_INTERVALS=0)
+BULK_WITHOUT_INTERVALS = {"binance", "bybit"}
+
+
+class MockExchange:
+    """
+    Stand-in for an async ccxt exchange client that serves synthetic markets, tickers and
+    funding rates with configurable latency, jitter and error rate. Every call is counted
+    in `calls` so benchmarks can report exchange requests per refresh. Intervals are also
+    exposed where the real exchanges expose them: Bybit markets list `fundingInterval` (in
+    minutes) and Binance's fetch_funding_intervals lists only the symbols not on 8h.
+    """
+
+    def __init__(self, exchange_id, universe_size=MOCK_UNIVERSE_SIZE, latency_ms=MOCK_LATENCY_MS,
+                 jitter_ms=MOCK_JITTER_MS, error_rate=MOCK_ERROR_RATE, bulk_intervals=MOCK_BULK_INTERVALS, seed=None):
+        self.id = exchange_id
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.bulk_intervals = bulk_intervals or exchange_id not in BULK_WITHOUT_INTERVALS
+        self.random = random.Random(seed if seed is not None else exchange_id)
+        self.calls = Counter()
+        self.has = {
+            "fetchFundingRates": True,
+            "fetchTickers": True,
+            "fetchFundingRateHistory": True,
+            "fetchFundingIntervals": exchange_id == "binance",
+            "watchFundingRates": True,
+        }
+        # Shared coins (listed everywhere), a few exchange-only listings and a spot market
+        coins = [f"COIN{i}" for i in range(universe_size)]
+        coins += [f"{exchange_id.upper()}ONLY{i}" for i in range(max(universe_size // 10, 1))]
+        self.markets = {f"{coin}/USDT:USDT": {"symbol": f"{coin}/USDT:USDT", "swap": True} for coin in coins}
+        self.markets["BTC/USDT"] = {"symbol": "BTC/USDT", "swap": False}
+        self.swaps = [s for s, m in self.markets.items() if m["swap"]]
+        self.rates = {s: self.random.uniform(-0.0005, 0.0010) for s in self.swaps}
+        self.intervals = {s: self.random.choice(["8h", "8h", "8h", "4h", "1h"]) for s in self.swaps}
+        self.volumes = {s: self.random.lognormvariate(16, 2) for s in self.swaps}
+        if exchange_id == "bybit":
+            for s in self.swaps:
+                self.markets[s]["info"] = {"fundingInterval": int(self.intervals[s][:-1]) * 60}
+
+    async def _call(self, method):
+        self.calls[method] += 1
+        await asyncio.sleep(max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter)))
+        if self.random.random() < self.error_rate:
+            raise ccxt.NetworkError(f"{self.id} {method} simulated failure")
+
+    def _drift(self, symbol):
+        # Small random walk so consecutive refreshes see changing rates
+        self.rates[symbol] += self.random.gauss(0, 0.00002)
+        return self.rates[symbol]
+
+    def _funding_rate(self, symbol, interval=True):
+        rate = {"symbol": symbol, "fundingRate": self._drift(symbol), "interval": self.intervals[symbol]}
+        if not interval:
+            rate["interval"] = None
+        return rate
+
+    async def load_markets(self, reload=False):
+        await self._call("load_markets")
+        return self.markets
+
+    async def fetch_funding_rate(self, symbol):
+        await self._call("fetch_funding_rate")
+        return self._funding_rate(symbol)
+
+    async def fetch_funding_rates(self, symbols=None):
+        await self._call("fetch_funding_rates")
+        return {s: self._funding_rate(s, self.bulk_intervals) for s in (symbols or self.swaps)}
+
+    async def fetch_funding_intervals(self, symbols=None):
+        # Like Binance's fundingInfo: only symbols whose interval differs from 8h are listed
+        await self._call("fetch_funding_intervals")
+        return {
+            s: {"symbol": s, "interval": self.intervals[s]}
+            for s in (symbols or self.swaps) if self.intervals[s] != "8h"
+        }
+
+    async def fetch_ticker(self, symbol):
+        await self._call("fetch_ticker")
+        return {"symbol": symbol, "quoteVolume": self.volumes[symbol]}
+
+    async def fetch_tickers(self, symbols=None):
+        await self._call("fetch_tickers")
+        return {s: {"symbol": s, "quoteVolume": self.volumes[s]} for s in (symbols or self.swaps)}
+
+    async def fetch_funding_rate_history(self, symbol, since=None, limit=None, params={}):
+        await self._call("fetch_funding_rate_history")
+        step = 8 * 3600 * 1000
+        now = int(time.time() * 1000)
+        listed = now - 1000 * step  # history starts about a year ago
+        if "after" in params or "until" in params:
+            # OKX-style `after` cursor (exclusive) or Bybit-style `until` (inclusive): the newest records
+            # up to it, newest first
+            end = min(now, params["after"] - 1 if "after" in params else params["until"]) // step * step
+            timestamps = [ts for ts in range(end, end - (limit or 100) * step, -step) if ts >= listed]
+        else:
+            start = max((since // step + 1) * step if since else now - 100 * step, listed // step * step)
+            timestamps = range(start, min(now, start + (limit or 100) * step), step)
+        return [
+            {"symbol": symbol, "timestamp": ts, "fundingRate": self.rates[symbol] + self.random.gauss(0, 0.0001)}
+            for ts in timestamps
+        ]
+
+    async def watch_funding_rates(self, symbols):
+        # One streamed update batch touching a few symbols
+        self.calls["watch_funding_rates"] += 1
+        await asyncio.sleep(max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter)))
+        updated = self.random.sample(symbols, min(len(symbols), 5))
+        return {s: self._funding_rate(s) for s in updated}
+
+    async def close(self):
+        pass
+
+
+def create_mock_exchanges(names, **options):
+    """
+    Creates one MockExchange per exchange name, configured from the MOCK_* environment
+    variables unless overridden through `options`.
+    """
+    return {name: MockExchange(name, **options) for name in names}
@@ -0,0 +1,116 @@
+# Precomputed API Responses
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+import orjson
+from fastapi import Response
+
+# Responses smaller than this are not worth compressing (bytes)
+GZIP_MIN_BYTES = 1024
+# Maximum number of distinct encoded responses kept in memory
+MAX_ENTRIES = 64
+
+
+def dumps(data):
+    """
+    Serializes data to JSON bytes with orjson (NaN/inf become null, as the frontend expects numbers or nothing).
+    """
+    return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+class EncodedResponse:
+    """
+    A JSON body serialized once, with its gzip-compressed form and an ETag
+    (content-based unless one is given).
+    """
+
+    __slots__ = ("body", "gzipped", "etag")
+
+    def __init__(self, data, etag=None):
+        self.body = dumps(data)
+        self.gzipped = gzip.compress(self.body, 5) if len(self.body) >= GZIP_MIN_BYTES else None
+        self.etag = etag or '"' + hashlib.blake2b(self.body, digest_size=12).hexdigest() + '"'
+
+
+class ResponseCache:
+    """
+    Keeps encoded responses keyed by whatever identifies their content (e.g., a snapshot version),
+    evicting the least recently used entries beyond MAX_ENTRIES. Safe to share between the event
+    loop and the threadpool that runs sync endpoints.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, build, etag=None):
+        """
+        Returns the encoded response for `key`, calling build() and encoding its result on a miss.
+        Building happens outside the lock, so a slow build never holds up hits on other keys.
+        """
+        with self._lock:
+            encoded = self.entries.get(key)
+            if encoded is not None:
+                self.entries.move_to_end(key)
+                return encoded
+        encoded = EncodedResponse(build(), etag)
+        with self._lock:
+            self.entries[key] = encoded
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return encoded
+
+
+def is_not_modified(request, etag):
+    """
+    Returns True if the client's If-None-Match header already names this ETag.
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in [tag.strip() for tag in header.split(",")]
+
+
+def key_etag(key):
+    """
+    Returns an ETag derived from a cache key, for responses that are streamed instead of cached.
+    """
+    return '"' + hashlib.blake2b(repr(key).encode(), digest_size=12).hexdigest() + '"'
+
+
+def not_modified(etag):
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+def send(request, encoded, headers=None):
+    """
+    Sends an encoded response: 304 if the client already has it, gzip if the client accepts it.
+    """
+    if is_not_modified(request, encoded.etag):
+        return not_modified(encoded.etag)
+    headers = {**(headers or {}), "ETag": encoded.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if encoded.gzipped is not None and "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        return Response(encoded.gzipped, media_type="application/json", headers=headers)
+    return Response(encoded.body, media_type="application/json", headers=headers)
+
+
+def iter_json(batches, ndjson=False):
+    """
+    Encodes an iterable of item batches as a JSON array (or one JSON document per line for NDJSON)
+    chunk by chunk, so only one batch is held in memory at a time.
+    """
+    if ndjson:
+        for batch in batches:
+            yield b"".join(dumps(item) + b"\n" for item in batch)
+        return
+    yield b"["
+    first = True
+    for batch in batches:
+        for item in batch:
+            yield dumps(item) if first else b"," + dumps(item)
+            first = False
+    yield b"]"
@@ -0,0 +1,263 @@
+# Multi-Worker Snapshot Sharing
+import asyncio
+import mmap
+import os
+import struct
+
+import orjson
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: multi-worker mode is not available
+    fcntl = None
+
+# Directory holding the collector lock and the shared snapshot file; setting it enables multi-worker mode
+SHARED_DIR = os.environ.get("FUNDING_SHARED_DIR")
+
+# How often workers check for a newly published snapshot, and the collector worker for changes to publish (seconds)
+POLL_INTERVAL = float(os.environ.get("FUNDING_SHARED_POLL", "0.25"))
+
+# How often following workers try to take over the collector lock (seconds)
+ELECTION_INTERVAL = 5
+
+# How often the collector worker publishes its metrics for the other workers' /metrics (seconds)
+METRICS_INTERVAL = 5
+
+# Sequence number (odd while a write is in progress) and payload length, followed by the payload
+HEADER = struct.Struct("<QQ")
+
+# Initial size of the shared snapshot file; it grows when a payload does not fit
+INITIAL_SIZE = 1 << 20
+
+
+def try_lock(path):
+    """
+    Tries to take an exclusive lock on the given file without blocking.
+    Returns the open file descriptor (the lock is held until it is closed or the process exits), or None.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+class SnapshotFile:
+    """
+    Memory-mapped file holding the latest published state, guarded by a sequence counter
+    (seqlock): the writer makes it odd while writing and even when done, and readers
+    discard what they read if the counter changed meanwhile. Readers only copy the
+    payload out of the mapping when the counter shows a new version.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self.fd).st_size < HEADER.size:
+            os.ftruncate(self.fd, INITIAL_SIZE)
+        self.map = mmap.mmap(self.fd, 0)
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+    def _remap(self, size):
+        # The writer grows the file; readers pick up the new size from the file itself
+        if os.fstat(self.fd).st_size < size:
+            os.ftruncate(self.fd, size)
+        self.map.close()
+        self.map = mmap.mmap(self.fd, 0)
+
+    def sequence(self):
+        return HEADER.unpack_from(self.map, 0)[0]
+
+    def write(self, payload):
+        """
+        Publishes a new payload (bytes), growing the file if needed.
+        """
+        end = HEADER.size + len(payload)
+        if end > len(self.map):
+            self._remap(max(end, 2 * len(self.map)))
+        sequence = self.sequence()
+        # A writer that died mid-write leaves the counter odd; keep it odd until this write completes
+        writing = sequence if sequence % 2 else sequence + 1
+        HEADER.pack_into(self.map, 0, writing, 0)
+        self.map[HEADER.size:end] = payload
+        HEADER.pack_into(self.map, 0, writing + 1, len(payload))
+
+    def read(self):
+        """
+        Returns (sequence, payload bytes) of the published state, or (sequence, None) if nothing
+        consistent is available right now (nothing published yet, or a write in progress).
+        """
+        sequence, length = HEADER.unpack_from(self.map, 0)
+        if sequence % 2 or length == 0:
+            return sequence, None
+        end = HEADER.size + length
+        if end > len(self.map):
+            self._remap(end)
+        payload = self.map[HEADER.size:end]
+        if self.sequence() != sequence:
+            return sequence, None
+        return sequence, payload
+
+
+class WorkerCoordinator:
+    """
+    Runs the app as several worker processes (e.g., `uvicorn main:app --workers 4`) with a
+    single collector. The worker holding the collector lock fetches from the exchanges,
+    stores history and publishes its state into the shared snapshot file; every other
+    worker installs that state into its own collector and serves requests from memory.
+    If the collector worker exits, another worker takes the lock over. The collector worker
+    also publishes its metrics, and picks up backfill requests that other workers received.
+    """
+
+    def __init__(self, collector, backfill, directory=SHARED_DIR, on_elected=None, on_update=None):
+        if fcntl is None:
+            raise RuntimeError("multi-worker mode requires fcntl (POSIX)")
+        os.makedirs(directory, exist_ok=True)
+        self.collector = collector
+        self.backfill = backfill
+        self.lock_path = os.path.join(directory, "collector.lock")
+        self.file = SnapshotFile(os.path.join(directory, "snapshot.mmap"))
+        self.metrics_file = SnapshotFile(os.path.join(directory, "metrics.mmap"))
+        self.backfill_request_path = os.path.join(directory, "backfill.request")
+        self.on_elected = on_elected  # async callable that starts collecting (exchange clients, streams)
+        self.on_update = on_update    # called with the previous snapshots after a following worker installs new ones
+        self.is_leader = False
+        self._lock_fd = None
+        self._task = None
+        self._metrics = (None, None)  # (sequence, state) of the last metrics read from the collector worker
+
+    def elect(self):
+        """
+        Tries to become the collector worker. Returns True if this worker holds the lock.
+        """
+        if self._lock_fd is None:
+            self._lock_fd = try_lock(self.lock_path)
+        self.is_leader = self._lock_fd is not None
+        return self.is_leader
+
+    async def start(self):
+        """
+        Starts collecting and publishing if this worker was elected, following otherwise.
+        """
+        if self.elect():
+            await self._lead()
+        else:
+            print(f"[workers] {os.getpid()} following the collector worker")
+            self.collector.following = True
+            self._task = asyncio.create_task(self._follow())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self.file.close()
+        self.metrics_file.close()
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    async def _lead(self):
+        print(f"[workers] {os.getpid()} is the collector worker")
+        self.collector.following = False
+        if self.on_elected:
+            await self.on_elected()
+        self._task = asyncio.create_task(self._publish_loop())
+
+    def _signature(self):
+        return (tuple(self.collector.versions.items()), self.collector.index.version, tuple(self.backfill.status.items()))
+
+    def publish(self):
+        """
+        Writes the collector's current state and the backfill progress to the shared snapshot file.
+        """
+        state = self.collector.export_state()
+        state["backfill"] = self.backfill.status
+        self.file.write(orjson.dumps(state, option=orjson.OPT_SERIALIZE_NUMPY))
+
+    def collector_metrics(self):
+        """
+        Returns the metric state last published by the collector worker (see metrics.export_state()),
+        or None if nothing has been published yet.
+        """
+        sequence, state = self._metrics
+        if self.metrics_file.sequence() != sequence:
+            sequence, payload = self.metrics_file.read()
+            if payload is not None:
+                self._metrics = sequence, orjson.loads(payload)
+        return self._metrics[1]
+
+    def request_backfill(self, days):
+        """
+        Asks the collector worker to start a backfill of the last `days` days (from a following worker).
+        """
+        tmp_path = self.backfill_request_path + f".{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(orjson.dumps({"days": days}))
+        os.replace(tmp_path, self.backfill_request_path)
+        return {"state": "requested", "days": days}
+
+    def _take_backfill_request(self):
+        # Claim the request file by renaming it, so a request is started at most once
+        taken_path = self.backfill_request_path + ".taken"
+        try:
+            os.replace(self.backfill_request_path, taken_path)
+        except FileNotFoundError:
+            return None
+        try:
+            with open(taken_path, "rb") as f:
+                return orjson.loads(f.read())["days"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[workers] ignoring unreadable backfill request: {e}")
+            return None
+        finally:
+            os.remove(taken_path)
+
+    async def _publish_loop(self):
+        published = None
+        loop = asyncio.get_running_loop()
+        next_metrics = loop.time()
+        while True:
+            days = self._take_backfill_request()
+            if days is not None:
+                self.backfill.start(days)
+            signature = self._signature()
+            if signature != published and self.collector.snapshots:
+                try:
+                    self.publish()
+                    published = signature
+                except Exception as e:
+                    print(f"[workers] publish failed: {e}")
+            if loop.time() >= next_metrics:
+                next_metrics = loop.time() + METRICS_INTERVAL
+                self.metrics_file.write(orjson.dumps(metrics.export_state()))
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def _follow(self):
+        installed = None
+        loop = asyncio.get_running_loop()
+        next_election = loop.time() + ELECTION_INTERVAL
+        while True:
+            if self.file.sequence() != installed:
+                sequence, payload = self.file.read()
+                if payload is not None:
+                    state = orjson.loads(payload)
+                    previous = dict(self.collector.snapshots)
+                    self.collector.install(state)
+                    self.backfill.status = state["backfill"]
+                    installed = sequence
+                    if self.on_update:
+                        self.on_update(previous)
+            if loop.time() >= next_election:
+                next_election = loop.time() + ELECTION_INTERVAL
+                if self.elect():
+                    # The collector worker exited: take over collecting and publishing
+                    await self._lead()
+                    return
+            await asyncio.sleep(POLL_INTERVAL)
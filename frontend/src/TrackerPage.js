@@ -127,6 +127,39 @@ function TrackerPage() {
     return () => clearInterval(intervalId);
   }, []);
 
+  // Subscribe to live funding and arbitrage updates pushed by the backend
+  useEffect(() => {
+    let socket;
+    let retryId;
+    const connect = () => {
+      socket = new WebSocket('ws://localhost:8080/ws/funding');
+      socket.onmessage = (event) => {
+        const message = JSON.parse(event.data);
+        if (message.type === 'snapshot') {
+          if (message.funding) setFundingData(message.funding);
+          if (message.arbitrage) setArbitrageData(message.arbitrage);
+        } else if (message.type === 'funding') {
+          // Merge only the rows that changed, keeping the volume ordering of the table
+          const changed = Object.fromEntries(message.rows.map(row => [row.symbol, row]));
+          setFundingData(rows => rows.map(row => changed[row.symbol] || row));
+        } else if (message.type === 'arbitrage') {
+          setArbitrageData(message.rows);
+        }
+        setLastUpdated(new Date());
+      };
+      // Reconnect after a short delay if the connection drops
+      socket.onclose = () => {
+        retryId = setTimeout(connect, 5000);
+      };
+    };
+    connect();
+    return () => {
+      clearTimeout(retryId);
+      socket.onclose = null;
+      socket.close();
+    };
+  }, []);
+
   // Fetch history data when history tab is selected
   useEffect(() => {
     if (value === 2) {
@@ -196,7 +229,7 @@ function TrackerPage() {
           <h1>Funding Rate Arbitrage Tracker</h1>
           {lastUpdated && (
             <p className="last-updated">
-              Last Updated (every 5 mins): {formatDate(lastUpdated)}
+              Last Updated (live): {formatDate(lastUpdated)}
             </p>
           )}
           <button className="go-home-btn" onClick={() => navigate("/")}>